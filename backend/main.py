@@ -1,10 +1,24 @@
 import os
 import re
 import json
+import math
 import asyncio
+import bisect
+import csv
+import glob
+import hashlib
+import inspect
+import io
 import logging
-from datetime import datetime, timedelta, timezone
-from fastapi.responses import FileResponse
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from operator import itemgetter
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import date, datetime, timedelta, timezone
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from playwright.async_api import async_playwright
 from playwright_stealth import Stealth
 
@@ -13,6 +27,20 @@ UTC = timezone.utc
 GMT_PLUS_8 = timezone(timedelta(hours=8))
 
 
+def split_pair(pair: str) -> tuple[str, str]:
+    """Split "SGD/MYR" into ("SGD", "MYR")."""
+    base, quote = pair.split("/")
+    return base, quote
+
+
+def pairs_by_base(pairs: list[str]) -> dict[str, list[str]]:
+    """Group pairs by base currency, so one request per base can fill all of them."""
+    grouped: dict[str, list[str]] = {}
+    for pair in pairs:
+        grouped.setdefault(split_pair(pair)[0], []).append(pair)
+    return grouped
+
+
 def to_utc(dt: datetime) -> datetime:
     """Convert a datetime to timezone-aware UTC.
     
@@ -26,17 +54,25 @@ def to_utc(dt: datetime) -> datetime:
         return dt.replace(tzinfo=GMT_PLUS_8).astimezone(UTC)
     return dt.astimezone(UTC)
 from contextlib import asynccontextmanager
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
 import asyncpg
+import duckdb
 import httpx
+import pyarrow as pa
+import pyarrow.parquet as pq
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from brotli_asgi import BrotliMiddleware
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
 from pywebpush import webpush, WebPushException
+from starlette.background import BackgroundTask
 
 # from playwright.async_api import async_playwright
 
@@ -52,9 +88,94 @@ logger = logging.getLogger(__name__)
 # Configuration
 SCRAPE_INTERVAL = int(os.getenv("SCRAPE_INTERVAL", 5))
 DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", 30))
+RATES_PARTITIONS_AHEAD = int(os.getenv("RATES_PARTITIONS_AHEAD", 7))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 10000))  # rows fetched and encoded per /rates/export chunk
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", 2))  # simultaneous /rates/export downloads
 DATABASE_CONNSTR = os.getenv("DATABASE_CONNSTR")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")  # "postgres" or "sqlite"
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/rates.db")
+# Currency pairs as "BASE/QUOTE"; the first tracked pair is the API default
+LEGACY_PAIR = "SGD/MYR"  # the only pair tracked before rates carried a pair column
+TRACKED_PAIRS = [pair.strip().upper() for pair in os.getenv("TRACKED_PAIRS", LEGACY_PAIR).split(",") if pair.strip()]
+DEFAULT_PAIR = TRACKED_PAIRS[0]
 VOLATILITY_THRESHOLD = float(os.getenv("VOLATILITY_THRESHOLD", 2.0))
 VOLATILITY_PERIOD_MINUTES = int(os.getenv("VOLATILITY_PERIOD_MINUTES", 60))
+VOLATILITY_METRIC = os.getenv("VOLATILITY_METRIC", "range")  # "range", "stddev" or "ewma"
+VOLATILITY_EWMA_ALPHA = float(os.getenv("VOLATILITY_EWMA_ALPHA", 0.3))
+VOLATILITY_COOLDOWN_MINUTES = int(os.getenv("VOLATILITY_COOLDOWN_MINUTES", 60))
+
+# Shared HTTP client settings for all scrapers
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 120))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "True").lower() == "true"
+SCRAPER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Responses larger than this are brotli (or gzip) compressed when the client accepts it
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 500))
+COMPRESSION_QUALITY = int(os.getenv("COMPRESSION_QUALITY", 4))
+
+# Rollup bucket sizes in seconds, and the longest /rates/trends range each one serves
+ROLLUP_RESOLUTIONS = {"5m": 300, "1h": 3600, "1d": 86400}
+ROLLUP_MAX_DAYS = {"5m": 2, "1h": 31}
+
+# Prometheus metrics, exposed on /metrics
+EVENT_LOOP_MONITOR_INTERVAL = float(os.getenv("EVENT_LOOP_MONITOR_INTERVAL", 0.25))
+SCRAPE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 8.0, 15.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+SCRAPER_DURATION = Histogram(
+    "scraper_duration_seconds", "Scraper run time including hedged retries", ["source"], buckets=SCRAPE_BUCKETS
+)
+SCRAPER_RUNS = Counter(
+    "scraper_runs_total", "Scraper runs by outcome (success, empty, timeout, error, skipped)", ["source", "outcome"]
+)
+SCRAPE_CYCLE_DURATION = Histogram(
+    "scrape_cycle_duration_seconds", "Time from starting a scrape cycle to its batch being processed",
+    buckets=SCRAPE_BUCKETS
+)
+ALERT_CHECK_DURATION = Histogram("alert_check_duration_seconds", "Alert check run time", ["check"])
+SAVE_RATES_DURATION = Histogram("save_rates_duration_seconds", "Time to persist a batch of rates")
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Storage operation latency", ["backend", "operation"])
+DB_ACQUIRE_WAIT = Histogram(
+    "db_acquire_wait_seconds", "Wait for a pooled connection (or the SQLite lock)", ["backend"], buckets=LAG_BUCKETS
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency", ["method", "route", "status"]
+)
+PUSH_SEND_DURATION = Histogram("push_send_duration_seconds", "Latency of a single web push request")
+PUSH_NOTIFICATIONS = Counter(
+    "push_notifications_total", "Outbox deliveries by outcome (delivered, retry, gone, dropped, deferred)", ["outcome"]
+)
+SCHEDULER_JOB_LAG = Histogram(
+    "scheduler_job_lag_seconds", "Delay between a job's scheduled and actual submission", ["job"], buckets=LAG_BUCKETS
+)
+SCHEDULER_JOBS_MISSED = Counter("scheduler_jobs_missed_total", "Job runs skipped past their misfire grace time", ["job"])
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a periodic timer, i.e. time spent blocked",
+    buckets=LAG_BUCKETS
+)
+
+
+def record_job_event(event):
+    """APScheduler listener feeding the scheduler lag and missed-run metrics."""
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_JOBS_MISSED.labels(event.job_id).inc()
+        return
+    now = datetime.now(UTC)
+    for run_time in event.scheduled_run_times:
+        SCHEDULER_JOB_LAG.labels(event.job_id).observe(max(0.0, (now - run_time).total_seconds()))
+
+
+async def monitor_event_loop():
+    """Sample event-loop blocking: any delay past a timer's deadline is time the loop was busy."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_MONITOR_INTERVAL)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - EVENT_LOOP_MONITOR_INTERVAL))
+
 
 # VAPID Keys
 VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY")
@@ -64,6 +185,11 @@ if not VAPID_PRIVATE_KEY:
     logger.warning("VAPID_PRIVATE_KEY not set. Push notifications will not work.")
 
 
+# Blocking pywebpush calls run on a bounded thread pool so they never stall the event loop
+PUSH_CONCURRENCY = int(os.getenv("PUSH_CONCURRENCY", 32))
+push_executor = ThreadPoolExecutor(max_workers=PUSH_CONCURRENCY, thread_name_prefix="webpush")
+
+
 async def send_push_notification(subscription_info: dict, message: str):
     """Send a push notification to a specific subscription."""
     if not VAPID_PRIVATE_KEY:
@@ -71,556 +197,2789 @@ async def send_push_notification(subscription_info: dict, message: str):
         raise ValueError("VAPID_PRIVATE_KEY not configured")
 
     try:
-        webpush(
-            subscription_info,
-            data=message,
-            vapid_private_key=VAPID_PRIVATE_KEY,
-            vapid_claims={"sub": VAPID_CLAIMS_EMAIL or "mailto:admin@example.com"}
-        )
+        loop = asyncio.get_running_loop()
+        with PUSH_SEND_DURATION.time():
+            await loop.run_in_executor(push_executor, partial(
+                webpush,
+                subscription_info,
+                data=message,
+                vapid_private_key=VAPID_PRIVATE_KEY,
+                vapid_claims={"sub": VAPID_CLAIMS_EMAIL or "mailto:admin@example.com"}
+            ))
         logger.info(f"Push notification sent successfully")
     except WebPushException as ex:
+        # 404/410 subscriptions are pruned by the outbox worker
         logger.error(f"WebPush error: {ex}")
-        # If 410 Gone, we should probably remove the subscription
-        if ex.response and ex.response.status_code == 410:
-             logger.info("Subscription expired/gone. TODO: Remove from DB")
         raise ex
     except Exception as ex:
         logger.error(f"Failed to send push notification: {ex}")
         raise ex
 
 
+async def send_push_notifications(notifications: list) -> list:
+    """Send (subscription_info, message) pairs concurrently.
+
+    Concurrency is bounded by the push executor; returns one result per
+    notification, either None or the exception raised for it.
+    """
+    return await asyncio.gather(
+        *(send_push_notification(info, message) for info, message in notifications),
+        return_exceptions=True
+    )
+
+
+# Durable push outbox drained by a background worker
+PUSH_OUTBOX_BATCH = int(os.getenv("PUSH_OUTBOX_BATCH", 500))
+PUSH_OUTBOX_POLL_SECONDS = int(os.getenv("PUSH_OUTBOX_POLL_SECONDS", 10))
+PUSH_MAX_ATTEMPTS = int(os.getenv("PUSH_MAX_ATTEMPTS", 6))
+PUSH_RETRY_BASE_SECONDS = int(os.getenv("PUSH_RETRY_BASE_SECONDS", 30))
+PUSH_ENDPOINT_MIN_INTERVAL = int(os.getenv("PUSH_ENDPOINT_MIN_INTERVAL", 60))
+
+push_outbox_wakeup = asyncio.Event()
+push_endpoint_last_sent: dict[str, float] = {}
+
+
+async def drain_push_outbox() -> int:
+    """Deliver one batch of due outbox rows. Returns the number of rows attempted.
+
+    Delivered rows are deleted, 404/410 responses delete the subscription and
+    its pending rows, and other failures are retried with exponential backoff
+    until PUSH_MAX_ATTEMPTS. Endpoints are sent to at most once per
+    PUSH_ENDPOINT_MIN_INTERVAL seconds; extra rows are deferred.
+    """
+    if not VAPID_PRIVATE_KEY or storage is None:
+        return 0
+
+    rows = await storage.fetch_due_notifications(PUSH_OUTBOX_BATCH)
+    if not rows:
+        return 0
+
+    now = time.monotonic()
+    due = []
+    deferred = []
+    batch_endpoints = set()
+    for row in rows:
+        last_sent = push_endpoint_last_sent.get(row['endpoint'])
+        if row['endpoint'] in batch_endpoints or (last_sent and now - last_sent < PUSH_ENDPOINT_MIN_INTERVAL):
+            deferred.append(row['id'])
+            continue
+        batch_endpoints.add(row['endpoint'])
+        due.append(row)
+
+    notifications = []
+    for row in due:
+        try:
+            keys = json.loads(row['keys_json'])
+        except Exception:
+            keys = {}
+        notifications.append(({"endpoint": row['endpoint'], "keys": keys}, row['message']))
+    results = await send_push_notifications(notifications)
+
+    delivered, gone, retries, dead = [], [], [], []
+    for row, result in zip(due, results):
+        push_endpoint_last_sent[row['endpoint']] = now
+        if result is None:
+            delivered.append(row['id'])
+        elif (
+            isinstance(result, WebPushException)
+            and result.response is not None
+            and result.response.status_code in (404, 410)
+        ):
+            gone.append(row['endpoint'])
+        elif row['attempts'] + 1 >= PUSH_MAX_ATTEMPTS:
+            dead.append(row['id'])
+            logger.error(f"Giving up on push to {row['endpoint'][:30]} after {row['attempts'] + 1} attempts: {result}")
+        else:
+            delay = PUSH_RETRY_BASE_SECONDS * 2 ** row['attempts']
+            retries.append((row['id'], delay, str(result)[:500]))
+
+    await storage.apply_delivery_results(
+        delivered + dead, gone, retries, deferred, PUSH_ENDPOINT_MIN_INTERVAL
+    )
+    if gone:
+        for endpoint in gone:
+            unindex_threshold(endpoint)
+        logger.info(f"Removed {len(gone)} expired subscriptions")
+
+    # Forget rate-limit entries that can no longer defer anything
+    for endpoint, last_sent in list(push_endpoint_last_sent.items()):
+        if now - last_sent >= PUSH_ENDPOINT_MIN_INTERVAL:
+            del push_endpoint_last_sent[endpoint]
+
+    for outcome, count in (
+        ("delivered", len(delivered)), ("retry", len(retries)), ("gone", len(gone)),
+        ("dropped", len(dead)), ("deferred", len(deferred))
+    ):
+        PUSH_NOTIFICATIONS.labels(outcome).inc(count)
+    logger.info(
+        f"Push outbox: {len(delivered)} delivered, {len(retries)} retrying, "
+        f"{len(gone)} gone, {len(dead)} dropped, {len(deferred)} deferred"
+    )
+    return len(due)
+
+
+async def push_outbox_worker():
+    """Drain the outbox whenever alerts are queued, polling for retries in between."""
+    while True:
+        try:
+            await asyncio.wait_for(push_outbox_wakeup.wait(), timeout=PUSH_OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        push_outbox_wakeup.clear()
+        try:
+            # Keep going while full batches are being sent
+            while await drain_push_outbox() >= PUSH_OUTBOX_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Push outbox worker failed: {e}")
+
+
+# In-memory threshold index: per pair, sorted (threshold, endpoint) lists per direction plus
+# endpoint -> (pair, threshold, threshold_type, keys_json). Kept in sync by the alert endpoints.
+threshold_above: dict[str, list[tuple[float, str]]] = {}
+threshold_below: dict[str, list[tuple[float, str]]] = {}
+threshold_subscriptions: dict[str, tuple[str, float, str, str]] = {}
+
+
+def unindex_threshold(endpoint: str):
+    """Remove an endpoint's threshold from the index, if present."""
+    entry = threshold_subscriptions.pop(endpoint, None)
+    if entry is None:
+        return
+    pair, threshold, threshold_type, _ = entry
+    side = (threshold_above if threshold_type == "above" else threshold_below).get(pair, [])
+    i = bisect.bisect_left(side, (threshold, endpoint))
+    if i < len(side) and side[i] == (threshold, endpoint):
+        del side[i]
+
+
+def index_threshold(
+    endpoint: str, keys_json: str, threshold: Optional[float], threshold_type: Optional[str], pair: str = DEFAULT_PAIR
+):
+    """Insert or replace an endpoint's threshold in the index."""
+    unindex_threshold(endpoint)
+    if threshold is None or threshold_type not in ("above", "below"):
+        return
+    side = (threshold_above if threshold_type == "above" else threshold_below).setdefault(pair, [])
+    bisect.insort(side, (threshold, endpoint))
+    threshold_subscriptions[endpoint] = (pair, threshold, threshold_type, keys_json)
+
+
+def clear_threshold_index():
+    """Drop every indexed threshold."""
+    threshold_above.clear()
+    threshold_below.clear()
+    threshold_subscriptions.clear()
+
+
+async def rebuild_threshold_index():
+    """Load all active thresholds from the database into the index."""
+    try:
+        rows = await storage.fetch_threshold_subscriptions()
+        clear_threshold_index()
+        for row in rows:
+            index_threshold(
+                row['endpoint'], row['keys_json'], row['threshold'], row['threshold_type'], row['pair']
+            )
+        logger.info(f"Indexed {len(threshold_subscriptions)} threshold subscriptions")
+    except Exception as e:
+        logger.error(f"Failed to build threshold index: {e}")
+
+
+def match_thresholds(rate: float, pair: str = DEFAULT_PAIR) -> list[str]:
+    """Return endpoints whose threshold on pair is crossed by rate."""
+    # "above" fires for thresholds <= rate, "below" for thresholds >= rate
+    above_side = threshold_above.get(pair, [])
+    below_side = threshold_below.get(pair, [])
+    above = above_side[:bisect.bisect_right(above_side, rate, key=itemgetter(0))]
+    below = below_side[bisect.bisect_left(below_side, rate, key=itemgetter(0)):]
+    return [endpoint for _, endpoint in above + below]
+
+
 async def check_threshold_alerts(rates: list):
-    """Check if any rates hit user thresholds."""
+    """Check if any (source_name, pair, rate) rates hit user thresholds."""
     if not rates:
         return
 
     try:
-        async with db_pool.acquire() as conn:
-            subscriptions = await conn.fetch("""
-                SELECT endpoint, keys_json, threshold, threshold_type
-                FROM subscriptions
-                WHERE threshold IS NOT NULL
-            """)
-
-            best_rate = max(rate for _, rate in rates)
-
-            for sub in subscriptions:
-                endpoint = sub['endpoint']
-                keys_json = sub['keys_json']
-                threshold = sub['threshold']
-                threshold_type = sub['threshold_type']
-                
-                should_notify = False
-                if threshold_type == "above" and best_rate >= threshold:
-                    should_notify = True
-                elif threshold_type == "below" and best_rate <= threshold:
-                    should_notify = True
-
-                if should_notify:
-                    logger.info(f"Threshold alert triggered for {endpoint}: rate {best_rate} {threshold_type} {threshold}")
-                    
-                    try:
-                        keys = json.loads(keys_json)
-                        subscription_info = {
-                            "endpoint": endpoint,
-                            "keys": keys
-                        }
-                        message = json.dumps({
-                            "title": "Rate Alert!",
-                            "body": f"Exchange rate is now {best_rate:.4f} (Threshold: {threshold:.4f})",
-                            "icon": "/icons/icon-192x192.png"
-                        })
-                        await send_push_notification(subscription_info, message)
-                        
-                        # One-time alert: Disable threshold after sending
-                        await conn.execute(
-                            "UPDATE subscriptions SET threshold = NULL WHERE endpoint = $1", 
-                            endpoint
-                        )
-                        logger.info(f"Disabled threshold for {endpoint} after alert.")
-                    except Exception as e:
-                        logger.error(f"Error processing subscription for {endpoint}: {e}")
+        best_rates: dict[str, float] = {}
+        for _, pair, rate in rates:
+            best_rates[pair] = max(rate, best_rates.get(pair, rate))
+
+        notifications = []
+        endpoints = []
+        for pair, best_rate in best_rates.items():
+            for endpoint in match_thresholds(best_rate, pair):
+                _, threshold, threshold_type, keys_json = threshold_subscriptions[endpoint]
+                logger.info(f"Threshold alert triggered for {endpoint}: {pair} {best_rate} {threshold_type} {threshold}")
+                endpoints.append(endpoint)
+                notifications.append((endpoint, keys_json, json.dumps({
+                    "title": "Rate Alert!",
+                    "body": f"{pair} is now {best_rate:.4f} (Threshold: {threshold:.4f})",
+                    "icon": "/icons/icon-192x192.png"
+                })))
+        if not endpoints:
+            return
+
+        # One-time alert: Disable threshold once the alert is queued for delivery
+        await storage.queue_threshold_alerts(notifications, endpoints)
+        for endpoint in endpoints:
+            unindex_threshold(endpoint)
+        push_outbox_wakeup.set()
+        logger.info(f"Queued threshold alerts and disabled threshold for {len(endpoints)} subscriptions.")
 
     except Exception as e:
         logger.error(f"Failed to check threshold alerts: {e}")
 
 
-async def send_volatility_notifications(source: str, volatility: float, min_rate: float, max_rate: float):
-    """Send volatility alert notifications."""
+async def send_volatility_notifications(
+    source: str, volatility: float, min_rate: float, max_rate: float, pair: str = DEFAULT_PAIR
+):
+    """Queue volatility alert notifications for every volatility subscriber of pair."""
     try:
-        async with db_pool.acquire() as conn:
-            subscriptions = await conn.fetch("""
-                SELECT endpoint, keys_json
-                FROM subscriptions
-                WHERE volatility_alert = TRUE
-            """)
-
-            for sub in subscriptions:
-                endpoint = sub['endpoint']
-                keys_json = sub['keys_json']
-                logger.info(f"Sending volatility notification to {endpoint}")
-                try:
-                    keys = json.loads(keys_json)
-                    subscription_info = {
-                        "endpoint": endpoint,
-                        "keys": keys
-                    }
-                    message = json.dumps({
-                        "title": "High Volatility Alert",
-                        "body": f"{source} rate changed by {volatility:.2f}% ({min_rate:.4f} - {max_rate:.4f})",
-                         "icon": "/icons/icon-192x192.png"
-                    })
-                    await send_push_notification(subscription_info, message)
-                except Exception as e:
-                     logger.error(f"Error processing volatility sub for {endpoint}: {e}")
+        message = json.dumps({
+            "title": "High Volatility Alert",
+            "body": f"{source} {pair} rate changed by {volatility:.2f}% ({min_rate:.4f} - {max_rate:.4f})",
+            "icon": "/icons/icon-192x192.png"
+        })
+        queued = await storage.queue_broadcast(message, volatility_only=True, pair=pair)
+        push_outbox_wakeup.set()
+        logger.info(f"Queued {queued} volatility notifications")
     except Exception as e:
         logger.error(f"Failed to send volatility notifications: {e}")
 
-# Global database connection pool
-db_pool: Optional[asyncpg.Pool] = None
 scheduler = AsyncIOScheduler()
 
+# Long-lived HTTP client shared by all scrapers (created in lifespan)
+http_client: Optional[httpx.AsyncClient] = None
+
+# In-memory snapshot of the latest rate per (source, pair), published after each scrape.
+# The dict is replaced wholesale (never mutated) so readers always see a consistent view.
+latest_snapshot: dict[tuple[str, str], tuple[float, datetime]] = {}
+snapshot_version = 0
+snapshot_updated_at: Optional[datetime] = None
+
+# Subscribers of /rates/stream, one small bounded queue per connection
+stream_subscribers: set[asyncio.Queue] = set()
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 4))
+STREAM_KEEPALIVE_SECONDS = int(os.getenv("STREAM_KEEPALIVE_SECONDS", 15))
+# Streams are closed after this long and EventSource reconnects, so no connection
+# outlives a graceful shutdown or --reload by more than this
+STREAM_MAX_SECONDS = int(os.getenv("STREAM_MAX_SECONDS", 120))
+STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", 2000))  # reconnect delay suggested to clients
+
+# Included in ETags so validators from a previous process never match after a restart
+BOOT_ID = format(time.time_ns(), "x")
+
 # Pydantic Models
 class RateResponse(BaseModel):
     source_name: str
     rate: float
     timestamp: datetime
+    pair: str = DEFAULT_PAIR
+
+
+class TrendDataPoint(BaseModel):
+    timestamp: datetime
+    source_name: str
+    rate: float
+
+
+class AlertSubscription(BaseModel):
+    endpoint: str
+    keys: dict
+    threshold: Optional[float] = None
+    threshold_type: Optional[str] = "above"  # "above" or "below"
+    volatility_alert: bool = False
+    pair: str = DEFAULT_PAIR
+
+
+class ConversionRequest(BaseModel):
+    amount: float
+    source: Optional[str] = None
+
+
+class RateHistoryItem(BaseModel):
+    rate: float
+    timestamp: datetime
+
+
+class SourceHistory(BaseModel):
+    source_name: str
+    recent_rates: list[RateHistoryItem]
+
+
+class PushTestRequest(BaseModel):
+    endpoint: str
+    keys: dict
+
+
+# ... (existing code) ...
+
+
+def rate_partition_name(day: date) -> str:
+    """Name of the rates partition holding a given UTC day."""
+    return f"rates_p{day:%Y%m%d}"
+
+
+async def create_partitioned_rates(conn: asyncpg.Connection, table: str):
+    """Create an empty day-partitioned rates table with a default partition."""
+    await conn.execute("CREATE SEQUENCE IF NOT EXISTS rates_id_seq")
+    await conn.execute(f"""
+        CREATE TABLE {table} (
+            id BIGINT NOT NULL DEFAULT nextval('rates_id_seq'),
+            timestamp TIMESTAMPTZ NOT NULL,
+            source_name VARCHAR NOT NULL,
+            rate DOUBLE PRECISION NOT NULL,
+            pair VARCHAR NOT NULL DEFAULT '{LEGACY_PAIR}',
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    # Catches rows outside the pre-created days (e.g. far-back backfills)
+    await conn.execute(f"CREATE TABLE IF NOT EXISTS rates_default PARTITION OF {table} DEFAULT")
+
+
+async def ensure_rate_partitions(conn: asyncpg.Connection, start: date, end: date, table: str = "rates"):
+    """Create daily partitions for every day in [start, end].
+
+    A day whose rows already landed in rates_default (e.g. after downtime longer
+    than RATES_PARTITIONS_AHEAD) cannot get a partition while the default holds
+    them, so the default is detached, the rows moved into the new partition and
+    the default re-attached, all in one transaction.
+    """
+    day = start
+    while day <= end:
+        name = rate_partition_name(day)
+        lower = datetime.combine(day, datetime.min.time(), UTC)
+        upper = lower + timedelta(days=1)
+        bounds = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name)
+        stranded = not exists and await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM rates_default WHERE timestamp >= $1 AND timestamp < $2)", lower, upper
+        )
+        if not exists and stranded:
+            async with conn.transaction():
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION rates_default")
+                await conn.execute(f"CREATE TABLE {name} PARTITION OF {table} {bounds}")
+                moved = await conn.execute(f"""
+                    INSERT INTO {name} (id, timestamp, source_name, pair, rate)
+                    SELECT id, timestamp, source_name, pair, rate FROM rates_default
+                    WHERE timestamp >= $1 AND timestamp < $2
+                """, lower, upper)
+                await conn.execute("DELETE FROM rates_default WHERE timestamp >= $1 AND timestamp < $2", lower, upper)
+                await conn.execute(f"ALTER TABLE {table} ATTACH PARTITION rates_default DEFAULT")
+            logger.info(f"Created {name}, moving rows out of rates_default ({moved})")
+        elif not exists:
+            await conn.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} {bounds}")
+        day += timedelta(days=1)
+
+
+async def migrate_rates_table(conn: asyncpg.Connection):
+    """Create the partitioned rates table, converting a legacy plain table in place.
+
+    The one-shot migration copies existing rows into a new partitioned table
+    and swaps it in within a single transaction.
+    """
+    kind = await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('rates')")
+    today = datetime.now(UTC).date()
+
+    if kind is None:
+        async with conn.transaction():
+            await create_partitioned_rates(conn, "rates")
+            await conn.execute("ALTER SEQUENCE rates_id_seq OWNED BY rates.id")
+            await ensure_rate_partitions(conn, today, today + timedelta(days=RATES_PARTITIONS_AHEAD))
+        logger.info("Created partitioned rates table")
+    elif kind == "r":
+        async with conn.transaction():
+            oldest = await conn.fetchval("SELECT MIN(timestamp) FROM rates")
+            start = max(
+                oldest.astimezone(UTC).date() if oldest else today,
+                today - timedelta(days=DATA_RETENTION_DAYS)
+            )
+            await create_partitioned_rates(conn, "rates_partitioned")
+            await ensure_rate_partitions(
+                conn, start, today + timedelta(days=RATES_PARTITIONS_AHEAD), table="rates_partitioned"
+            )
+            moved = await conn.execute("""
+                INSERT INTO rates_partitioned (id, timestamp, source_name, rate)
+                SELECT id, timestamp, source_name, rate FROM rates
+            """)
+            await conn.execute("SELECT setval('rates_id_seq', GREATEST((SELECT MAX(id) FROM rates_partitioned), 1))")
+            await conn.execute("ALTER SEQUENCE rates_id_seq OWNED BY NONE")
+            await conn.execute("DROP TABLE rates")
+            await conn.execute("ALTER TABLE rates_partitioned RENAME TO rates")
+            await conn.execute("ALTER SEQUENCE rates_id_seq OWNED BY rates.id")
+        logger.info(f"Migrated rates to a partitioned table ({moved})")
+
+
+# Storage backends
+def timed_operation(operation: str, method):
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            DB_QUERY_DURATION.labels(self.name, operation).observe(time.perf_counter() - start)
+    return wrapper
+
+
+class Storage:
+    """Persistence used by the API, scrape jobs and alert workers.
+
+    Rows are returned as mappings supporting row['column'] access, with
+    timestamps as timezone-aware datetimes.
+    """
+
+    name = "base"
+
+    def __init_subclass__(cls, **kwargs):
+        """Time every storage operation a backend implements in DB_QUERY_DURATION."""
+        super().__init_subclass__(**kwargs)
+        for operation, method in list(vars(cls).items()):
+            if (
+                operation not in ("init", "close")
+                and inspect.iscoroutinefunction(method)
+                and inspect.iscoroutinefunction(getattr(Storage, operation, None))
+            ):
+                setattr(cls, operation, timed_operation(operation, method))
+
+    async def init(self):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def ping(self):
+        raise NotImplementedError
+
+    # Rates
+    async def save_rates(self, records: list):
+        """Insert time-ordered (timestamp, source_name, pair, rate) records and fold them into the rollups."""
+        raise NotImplementedError
+
+    async def fetch_recent_rates(self, per_source: int, pair: str = DEFAULT_PAIR) -> list:
+        """Most recent per_source rows (source_name, rate, timestamp) of pair for every source."""
+        raise NotImplementedError
+
+    async def fetch_rates_since(self, cutoff: datetime) -> list:
+        """All rows (source_name, pair, rate, timestamp) newer than cutoff, oldest first."""
+        raise NotImplementedError
+
+    async def fetch_trends(
+        self, resolution: str, cutoff: datetime, source: Optional[str] = None, pair: str = DEFAULT_PAIR
+    ) -> list:
+        """Averaged rollup rows (timestamp, source_name, rate) of pair from cutoff onwards."""
+        raise NotImplementedError
+
+    def export_rates(
+        self, pair: str, start: datetime, end: datetime, sources: Optional[list], resolution: str, chunk_rows: int
+    ) -> AsyncIterator[list]:
+        """Yield (timestamp, source_name, rate) tuples of pair in [start, end), oldest first, chunk_rows at a time.
+
+        resolution "raw" reads the rates table, anything else the bucket means
+        of that rollup. Rows are read through a server-side cursor, so memory
+        does not grow with the range.
+        """
+        raise NotImplementedError
+
+    async def maintain(self):
+        """Periodic housekeeping ahead of new data (e.g. partition creation)."""
+
+    async def cleanup(self, cutoff: datetime):
+        """Archive and remove raw rows and fine rollups older than cutoff."""
+        raise NotImplementedError
+
+    # Subscriptions
+    async def get_subscription(self, endpoint: str):
+        raise NotImplementedError
+
+    async def upsert_subscription(self, subscription: "AlertSubscription"):
+        raise NotImplementedError
+
+    async def list_subscriptions(self) -> list:
+        raise NotImplementedError
+
+    async def fetch_threshold_subscriptions(self) -> list:
+        raise NotImplementedError
+
+    async def delete_subscription(self, endpoint: str):
+        """Remove a subscription and its pending notifications."""
+        raise NotImplementedError
+
+    async def clear_subscriptions(self):
+        raise NotImplementedError
+
+    # Push outbox
+    async def queue_threshold_alerts(self, notifications: list, endpoints: list):
+        """Queue (endpoint, keys_json, message) rows and clear the endpoints' thresholds atomically."""
+        raise NotImplementedError
+
+    async def queue_broadcast(self, message: str, volatility_only: bool = False, pair: Optional[str] = None) -> int:
+        """Queue message for every (volatility) subscriber, optionally only those of pair. Returns the number queued."""
+        raise NotImplementedError
+
+    async def fetch_due_notifications(self, limit: int) -> list:
+        raise NotImplementedError
+
+    async def apply_delivery_results(
+        self, finished: list, gone: list, retries: list, deferred: list, defer_seconds: int
+    ):
+        """Delete finished ids, drop gone endpoints, reschedule (id, delay, error) retries and defer ids."""
+        raise NotImplementedError
+
+
+class PostgresStorage(Storage):
+    """asyncpg-backed storage with a day-partitioned rates table."""
+
+    name = "postgres"
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.pool: Optional[asyncpg.Pool] = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Acquire a pooled connection, recording how long the wait took."""
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            DB_ACQUIRE_WAIT.labels(self.name).observe(time.perf_counter() - start)
+            yield conn
+
+    async def init(self):
+        self.pool = await asyncpg.create_pool(self.dsn)
+
+        async with self.connection() as conn:
+            # Create rates table (range-partitioned by day, migrating a legacy plain table)
+            await migrate_rates_table(conn)
+            await conn.execute(
+                f"ALTER TABLE rates ADD COLUMN IF NOT EXISTS pair VARCHAR NOT NULL DEFAULT '{LEGACY_PAIR}'"
+            )
+            # Catch up on partitions missed while the app (and the daily maintenance job) was down
+            today = datetime.now(UTC).date()
+            await ensure_rate_partitions(conn, today, today + timedelta(days=RATES_PARTITIONS_AHEAD))
+
+            # Create subscriptions table
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    id SERIAL PRIMARY KEY,
+                    endpoint VARCHAR UNIQUE NOT NULL,
+                    keys_json VARCHAR NOT NULL,
+                    threshold DOUBLE PRECISION,
+                    threshold_type VARCHAR DEFAULT 'above',
+                    volatility_alert BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await conn.execute(
+                f"ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS pair VARCHAR NOT NULL DEFAULT '{LEGACY_PAIR}'"
+            )
+
+            # Create push outbox table (drained by push_outbox_worker)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS push_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    endpoint VARCHAR NOT NULL,
+                    keys_json VARCHAR NOT NULL,
+                    message VARCHAR NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    last_error VARCHAR,
+                    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create rollups table (OHLC + running sum per bucket, maintained by the scrape job)
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS rate_rollups (
+                    resolution VARCHAR NOT NULL,
+                    source_name VARCHAR NOT NULL,
+                    pair VARCHAR NOT NULL DEFAULT '{LEGACY_PAIR}',
+                    bucket TIMESTAMPTZ NOT NULL,
+                    open DOUBLE PRECISION NOT NULL,
+                    open_at TIMESTAMPTZ NOT NULL,
+                    high DOUBLE PRECISION NOT NULL,
+                    low DOUBLE PRECISION NOT NULL,
+                    close DOUBLE PRECISION NOT NULL,
+                    close_at TIMESTAMPTZ NOT NULL,
+                    rate_sum DOUBLE PRECISION NOT NULL,
+                    sample_count INTEGER NOT NULL,
+                    PRIMARY KEY (resolution, pair, source_name, bucket)
+                )
+            """)
+            # Rollups created before pairs existed get the column and a pair-aware key
+            has_pair = await conn.fetchval("""
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'rate_rollups' AND column_name = 'pair'
+                )
+            """)
+            if not has_pair:
+                async with conn.transaction():
+                    await conn.execute(
+                        f"ALTER TABLE rate_rollups ADD COLUMN pair VARCHAR NOT NULL DEFAULT '{LEGACY_PAIR}'"
+                    )
+                    await conn.execute("""
+                        ALTER TABLE rate_rollups
+                        DROP CONSTRAINT rate_rollups_pkey,
+                        ADD PRIMARY KEY (resolution, pair, source_name, bucket)
+                    """)
+            # Rollups created before open_at/close_at existed: open and close are taken to be as old as their bucket
+            for column in ("open_at", "close_at"):
+                has_column = await conn.fetchval("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'rate_rollups' AND column_name = $1
+                    )
+                """, column)
+                if not has_column:
+                    async with conn.transaction():
+                        await conn.execute(f"ALTER TABLE rate_rollups ADD COLUMN {column} TIMESTAMPTZ")
+                        await conn.execute(f"UPDATE rate_rollups SET {column} = bucket")
+                        await conn.execute(f"ALTER TABLE rate_rollups ALTER COLUMN {column} SET NOT NULL")
+
+            # Create indices
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_rates_timestamp ON rates(timestamp)")
+            # Covering index for per-pair, per-source "most recent N" lookups; supersedes
+            # idx_rates_source and idx_rates_source_timestamp
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_rates_pair_source_timestamp
+                ON rates(pair, source_name, timestamp DESC) INCLUDE (rate)
+            """)
+            await conn.execute("DROP INDEX IF EXISTS idx_rates_source")
+            await conn.execute("DROP INDEX IF EXISTS idx_rates_source_timestamp")
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_rate_rollups_pair_bucket ON rate_rollups(resolution, pair, bucket)"
+            )
+            await conn.execute("DROP INDEX IF EXISTS idx_rate_rollups_bucket")
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_push_outbox_next_attempt ON push_outbox(next_attempt_at, id)"
+            )
+
+            # Backfill rollups from raw history the first time the table is created
+            if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM rate_rollups)"):
+                for resolution, step in ROLLUP_RESOLUTIONS.items():
+                    await conn.execute("""
+                        INSERT INTO rate_rollups
+                            (resolution, source_name, pair, bucket, open, open_at, high, low, close, close_at, rate_sum, sample_count)
+                        SELECT $1, source_name, pair,
+                               to_timestamp(floor(extract(epoch FROM timestamp)::double precision / $2::int) * $2::int) AS bucket,
+                               (array_agg(rate ORDER BY timestamp ASC))[1], MIN(timestamp),
+                               MAX(rate), MIN(rate),
+                               (array_agg(rate ORDER BY timestamp DESC))[1], MAX(timestamp),
+                               SUM(rate), COUNT(*)
+                        FROM rates
+                        GROUP BY source_name, pair, bucket
+                    """, resolution, step)
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+
+    async def ping(self):
+        async with self.connection() as conn:
+            await conn.fetchval("SELECT 1")
+
+    async def save_rates(self, records: list):
+        # Raw rows are streamed with COPY and the rollups are updated in the same transaction
+        async with self.connection() as conn:
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "rates",
+                    records=records,
+                    columns=["timestamp", "source_name", "pair", "rate"]
+                )
+                # open only moves back and close only forward in time, so rates arriving out of order
+                # (backfills, retries, late hedged results) keep the OHLC right
+                await conn.executemany("""
+                    INSERT INTO rate_rollups
+                        (resolution, source_name, pair, bucket, open, open_at, high, low, close, close_at, rate_sum, sample_count)
+                    VALUES ($1, $2, $3, $4, $5, $6, $5, $5, $5, $6, $5, 1)
+                    ON CONFLICT (resolution, pair, source_name, bucket) DO UPDATE SET
+                        open = CASE WHEN EXCLUDED.open_at < rate_rollups.open_at
+                                    THEN EXCLUDED.open ELSE rate_rollups.open END,
+                        open_at = LEAST(rate_rollups.open_at, EXCLUDED.open_at),
+                        high = GREATEST(rate_rollups.high, EXCLUDED.high),
+                        low = LEAST(rate_rollups.low, EXCLUDED.low),
+                        close = CASE WHEN EXCLUDED.close_at >= rate_rollups.close_at
+                                     THEN EXCLUDED.close ELSE rate_rollups.close END,
+                        close_at = GREATEST(rate_rollups.close_at, EXCLUDED.close_at),
+                        rate_sum = rate_rollups.rate_sum + EXCLUDED.rate_sum,
+                        sample_count = rate_rollups.sample_count + 1
+                """, rollup_records(records))
+
+    async def fetch_recent_rates(self, per_source: int, pair: str = DEFAULT_PAIR) -> list:
+        async with self.connection() as conn:
+            rows = await conn.fetch(
+                RECENT_RATES_PER_SOURCE_SQL, per_source, pair, datetime.now(UTC) - RECENT_RATES_WINDOW
+            )
+            if not rows:
+                # Nothing scraped recently (e.g. after a long outage): search the whole table
+                rows = await conn.fetch(RECENT_RATES_PER_SOURCE_SQL, per_source, pair, datetime.min.replace(tzinfo=UTC))
+            return rows
+
+    async def fetch_rates_since(self, cutoff: datetime) -> list:
+        async with self.connection() as conn:
+            return await conn.fetch("""
+                SELECT source_name, pair, rate, timestamp
+                FROM rates
+                WHERE timestamp > $1
+                ORDER BY timestamp ASC
+            """, cutoff)
+
+    async def fetch_trends(
+        self, resolution: str, cutoff: datetime, source: Optional[str] = None, pair: str = DEFAULT_PAIR
+    ) -> list:
+        async with self.connection() as conn:
+            if source:
+                return await conn.fetch("""
+                    SELECT bucket as timestamp, source_name, ROUND((rate_sum / sample_count)::numeric, 4)::float8 as rate
+                    FROM rate_rollups
+                    WHERE resolution = $1 AND pair = $2 AND bucket >= $3 AND source_name = $4
+                    ORDER BY bucket ASC
+                """, resolution, pair, cutoff, source)
+            return await conn.fetch("""
+                SELECT bucket as timestamp, source_name, ROUND((rate_sum / sample_count)::numeric, 4)::float8 as rate
+                FROM rate_rollups
+                WHERE resolution = $1 AND pair = $2 AND bucket >= $3
+                ORDER BY bucket ASC
+            """, resolution, pair, cutoff)
+
+    async def export_rates(
+        self, pair: str, start: datetime, end: datetime, sources: Optional[list], resolution: str, chunk_rows: int
+    ) -> AsyncIterator[list]:
+        if resolution == "raw":
+            query = """
+                SELECT timestamp, source_name, rate
+                FROM rates
+                WHERE pair = $1 AND timestamp >= $2 AND timestamp < $3
+                  AND ($4::varchar[] IS NULL OR source_name = ANY($4))
+                ORDER BY timestamp, source_name
+            """
+            args = [pair, start, end, sources]
+        else:
+            query = """
+                SELECT bucket AS timestamp, source_name, ROUND((rate_sum / sample_count)::numeric, 4)::float8 AS rate
+                FROM rate_rollups
+                WHERE pair = $1 AND bucket >= $2 AND bucket < $3
+                  AND ($4::varchar[] IS NULL OR source_name = ANY($4)) AND resolution = $5
+                ORDER BY bucket, source_name
+            """
+            args = [pair, start, end, sources, resolution]
+        # A download lasts as long as the client keeps reading, so it gets its own
+        # connection rather than holding one of the pool's away from the API and scrapers
+        conn = await asyncpg.connect(self.dsn)
+        try:
+            # Cursors only live inside a transaction
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(query, *args)
+                while rows := await cursor.fetch(chunk_rows):
+                    yield [tuple(row) for row in rows]
+        finally:
+            await conn.close()
+
+    async def maintain(self):
+        today = datetime.now(UTC).date()
+        async with self.connection() as conn:
+            await ensure_rate_partitions(conn, today, today + timedelta(days=RATES_PARTITIONS_AHEAD))
+
+    async def cleanup(self, cutoff: datetime):
+        async with self.connection() as conn:
+            dropped = await drop_expired_partitions(conn, cutoff)
+            if dropped:
+                logger.info(f"Dropped expired rates partitions: {', '.join(dropped)}")
+            # The default partition only holds stragglers, so a DELETE stays cheap
+            async with conn.transaction():
+                await archive_rows(
+                    conn,
+                    "SELECT timestamp, source_name, pair, rate FROM rates_default WHERE timestamp < $1",
+                    cutoff,
+                    path=os.path.join(ARCHIVE_DIR, f"rates_default_{cutoff:%Y%m%d%H%M%S}.parquet")
+                )
+                await conn.execute(
+                    "DELETE FROM rates_default WHERE timestamp < $1",
+                    cutoff
+                )
+            # Daily rollups are tiny, so they outlive the raw data
+            await conn.execute(
+                "DELETE FROM rate_rollups WHERE resolution <> '1d' AND bucket < $1",
+                cutoff
+            )
+
+    async def get_subscription(self, endpoint: str):
+        async with self.connection() as conn:
+            return await conn.fetchrow("""
+                SELECT threshold, threshold_type, volatility_alert, pair
+                FROM subscriptions
+                WHERE endpoint = $1
+            """, endpoint)
+
+    async def upsert_subscription(self, subscription: "AlertSubscription"):
+        async with self.connection() as conn:
+            res = await conn.execute("""
+                INSERT INTO subscriptions (endpoint, keys_json, threshold, threshold_type, volatility_alert, pair)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (endpoint) DO UPDATE SET
+                    keys_json = EXCLUDED.keys_json,
+                    threshold = EXCLUDED.threshold,
+                    threshold_type = EXCLUDED.threshold_type,
+                    volatility_alert = EXCLUDED.volatility_alert,
+                    pair = EXCLUDED.pair
+            """,
+            subscription.endpoint,
+            json.dumps(subscription.keys),
+            subscription.threshold,
+            subscription.threshold_type,
+            subscription.volatility_alert,
+            subscription.pair
+            )
+            logger.info(f"Subscription DB Result: {res}")
+
+    async def list_subscriptions(self) -> list:
+        async with self.connection() as conn:
+            return await conn.fetch(
+                "SELECT endpoint, threshold, threshold_type, volatility_alert, pair, created_at FROM subscriptions"
+            )
+
+    async def fetch_threshold_subscriptions(self) -> list:
+        async with self.connection() as conn:
+            return await conn.fetch("""
+                SELECT endpoint, keys_json, threshold, threshold_type, pair
+                FROM subscriptions
+                WHERE threshold IS NOT NULL
+            """)
+
+    async def delete_subscription(self, endpoint: str):
+        async with self.connection() as conn:
+            await conn.execute("DELETE FROM subscriptions WHERE endpoint = $1", endpoint)
+            await conn.execute("DELETE FROM push_outbox WHERE endpoint = $1", endpoint)
+
+    async def clear_subscriptions(self):
+        async with self.connection() as conn:
+            await conn.execute("DELETE FROM subscriptions")
+            await conn.execute("DELETE FROM push_outbox")
+
+    async def queue_threshold_alerts(self, notifications: list, endpoints: list):
+        async with self.connection() as conn:
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "push_outbox",
+                    records=notifications,
+                    columns=["endpoint", "keys_json", "message"]
+                )
+                await conn.execute(
+                    "UPDATE subscriptions SET threshold = NULL WHERE endpoint = ANY($1::varchar[])",
+                    endpoints
+                )
+
+    async def queue_broadcast(self, message: str, volatility_only: bool = False, pair: Optional[str] = None) -> int:
+        async with self.connection() as conn:
+            res = await conn.execute("""
+                INSERT INTO push_outbox (endpoint, keys_json, message)
+                SELECT endpoint, keys_json, $1
+                FROM subscriptions
+                WHERE (volatility_alert = TRUE OR NOT $2) AND ($3::varchar IS NULL OR pair = $3)
+            """, message, volatility_only, pair)
+        return int(res.split()[-1])
+
+    async def fetch_due_notifications(self, limit: int) -> list:
+        async with self.connection() as conn:
+            return await conn.fetch("""
+                SELECT id, endpoint, keys_json, message, attempts
+                FROM push_outbox
+                WHERE next_attempt_at <= NOW()
+                ORDER BY id
+                LIMIT $1
+            """, limit)
+
+    async def apply_delivery_results(
+        self, finished: list, gone: list, retries: list, deferred: list, defer_seconds: int
+    ):
+        async with self.connection() as conn:
+            async with conn.transaction():
+                if finished:
+                    await conn.execute("DELETE FROM push_outbox WHERE id = ANY($1::bigint[])", finished)
+                if gone:
+                    await conn.execute("DELETE FROM push_outbox WHERE endpoint = ANY($1::varchar[])", gone)
+                    await conn.execute("DELETE FROM subscriptions WHERE endpoint = ANY($1::varchar[])", gone)
+                if retries:
+                    await conn.executemany("""
+                        UPDATE push_outbox
+                        SET attempts = attempts + 1,
+                            next_attempt_at = NOW() + make_interval(secs => $2),
+                            last_error = $3
+                        WHERE id = $1
+                    """, retries)
+                if deferred:
+                    await conn.execute("""
+                        UPDATE push_outbox
+                        SET next_attempt_at = NOW() + make_interval(secs => $2)
+                        WHERE id = ANY($1::bigint[])
+                    """, deferred, defer_seconds)
+
+
+def sqlite_timestamp(dt: datetime) -> str:
+    """Fixed-width UTC ISO string, so text comparison matches time order."""
+    return dt.astimezone(UTC).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class SQLiteStorage(Storage):
+    """Embedded single-file storage using SQLite in WAL mode.
+
+    Needs no database server, which suits single-box deployments, tests and
+    benchmarks. Calls are serialized on one connection and run in a worker
+    thread so they never block the event loop.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = asyncio.Lock()
+
+    async def run(self, fn, *args):
+        start = time.perf_counter()
+        async with self.lock:
+            DB_ACQUIRE_WAIT.labels(self.name).observe(time.perf_counter() - start)
+            return await asyncio.to_thread(fn, *args)
+
+    def rows(self, cursor: sqlite3.Cursor, *timestamp_columns: str) -> list:
+        result = []
+        for row in cursor.fetchall():
+            item = dict(row)
+            for column in timestamp_columns:
+                if item.get(column) is not None:
+                    item[column] = normalize_timestamp(datetime.fromisoformat(item[column]))
+            result.append(item)
+        return result
+
+    async def init(self):
+        def init_sync():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            with self.conn:
+                self.migrate_pairs()
+                self.conn.executescript(f"""
+                    CREATE TABLE IF NOT EXISTS rates (
+                        id INTEGER PRIMARY KEY,
+                        timestamp TEXT NOT NULL,
+                        source_name TEXT NOT NULL,
+                        rate REAL NOT NULL,
+                        pair TEXT NOT NULL DEFAULT '{LEGACY_PAIR}'
+                    );
+                    CREATE TABLE IF NOT EXISTS subscriptions (
+                        id INTEGER PRIMARY KEY,
+                        endpoint TEXT UNIQUE NOT NULL,
+                        keys_json TEXT NOT NULL,
+                        threshold REAL,
+                        threshold_type TEXT DEFAULT 'above',
+                        volatility_alert INTEGER DEFAULT 0,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                        pair TEXT NOT NULL DEFAULT '{LEGACY_PAIR}'
+                    );
+                    CREATE TABLE IF NOT EXISTS push_outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        endpoint TEXT NOT NULL,
+                        keys_json TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_at TEXT NOT NULL,
+                        last_error TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE TABLE IF NOT EXISTS rate_rollups (
+                        resolution TEXT NOT NULL,
+                        source_name TEXT NOT NULL,
+                        pair TEXT NOT NULL DEFAULT '{LEGACY_PAIR}',
+                        bucket TEXT NOT NULL,
+                        open REAL NOT NULL,
+                        open_at TEXT NOT NULL,
+                        high REAL NOT NULL,
+                        low REAL NOT NULL,
+                        close REAL NOT NULL,
+                        close_at TEXT NOT NULL,
+                        rate_sum REAL NOT NULL,
+                        sample_count INTEGER NOT NULL,
+                        PRIMARY KEY (resolution, pair, source_name, bucket)
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_rates_timestamp ON rates(timestamp);
+                    CREATE INDEX IF NOT EXISTS idx_rates_pair_source_timestamp ON rates(pair, source_name, timestamp DESC, rate);
+                    DROP INDEX IF EXISTS idx_rates_source_timestamp;
+                    CREATE INDEX IF NOT EXISTS idx_rate_rollups_pair_bucket ON rate_rollups(resolution, pair, bucket);
+                    DROP INDEX IF EXISTS idx_rate_rollups_bucket;
+                    CREATE INDEX IF NOT EXISTS idx_push_outbox_next_attempt ON push_outbox(next_attempt_at, id);
+                """)
+        await self.run(init_sync)
+
+    def migrate_pairs(self):
+        """Add the pair column to tables created before pairs existed, and open_at/close_at to old rollups."""
+        def columns(table: str) -> set:
+            return {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+
+        for table in ("rates", "subscriptions"):
+            existing = columns(table)
+            if existing and "pair" not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN pair TEXT NOT NULL DEFAULT '{LEGACY_PAIR}'")
+        existing = columns("rate_rollups")
+        if existing and "pair" not in existing:
+            # The primary key changes, so the table is rebuilt
+            self.conn.execute("ALTER TABLE rate_rollups RENAME TO rate_rollups_legacy")
+            self.conn.execute("DROP INDEX IF EXISTS idx_rate_rollups_bucket")
+            self.conn.execute(f"""
+                CREATE TABLE rate_rollups (
+                    resolution TEXT NOT NULL,
+                    source_name TEXT NOT NULL,
+                    pair TEXT NOT NULL DEFAULT '{LEGACY_PAIR}',
+                    bucket TEXT NOT NULL,
+                    open REAL NOT NULL,
+                    open_at TEXT NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    close_at TEXT NOT NULL,
+                    rate_sum REAL NOT NULL,
+                    sample_count INTEGER NOT NULL,
+                    PRIMARY KEY (resolution, pair, source_name, bucket)
+                )
+            """)
+            self.conn.execute("""
+                INSERT INTO rate_rollups
+                    (resolution, source_name, bucket, open, open_at, high, low, close, close_at, rate_sum, sample_count)
+                SELECT resolution, source_name, bucket, open, bucket, high, low, close, bucket, rate_sum, sample_count
+                FROM rate_rollups_legacy
+            """)
+            self.conn.execute("DROP TABLE rate_rollups_legacy")
+        elif existing:
+            # The open and close of existing buckets are taken to be as old as the bucket
+            for column in ("open_at", "close_at"):
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE rate_rollups ADD COLUMN {column} TEXT")
+                    self.conn.execute(f"UPDATE rate_rollups SET {column} = bucket")
+
+    async def close(self):
+        if self.conn:
+            await self.run(self.conn.close)
+
+    async def ping(self):
+        await self.run(lambda: self.conn.execute("SELECT 1").fetchone())
+
+    async def save_rates(self, records: list):
+        def save_sync():
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO rates (timestamp, source_name, pair, rate) VALUES (?, ?, ?, ?)",
+                    [(sqlite_timestamp(ts), source_name, pair, rate) for ts, source_name, pair, rate in records]
+                )
+                self.conn.executemany("""
+                    INSERT INTO rate_rollups
+                        (resolution, source_name, pair, bucket, open, open_at, high, low, close, close_at, rate_sum, sample_count)
+                    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?5, ?5, ?5, ?6, ?5, 1)
+                    ON CONFLICT (resolution, pair, source_name, bucket) DO UPDATE SET
+                        open = CASE WHEN excluded.open_at < rate_rollups.open_at
+                                    THEN excluded.open ELSE rate_rollups.open END,
+                        open_at = MIN(rate_rollups.open_at, excluded.open_at),
+                        high = MAX(rate_rollups.high, excluded.high),
+                        low = MIN(rate_rollups.low, excluded.low),
+                        close = CASE WHEN excluded.close_at >= rate_rollups.close_at
+                                     THEN excluded.close ELSE rate_rollups.close END,
+                        close_at = MAX(rate_rollups.close_at, excluded.close_at),
+                        rate_sum = rate_rollups.rate_sum + excluded.rate_sum,
+                        sample_count = rate_rollups.sample_count + 1
+                """, [
+                    (resolution, source_name, pair, sqlite_timestamp(bucket), rate, sqlite_timestamp(timestamp))
+                    for resolution, source_name, pair, bucket, rate, timestamp in rollup_records(records)
+                ])
+        await self.run(save_sync)
+
+    async def fetch_recent_rates(self, per_source: int, pair: str = DEFAULT_PAIR) -> list:
+        def fetch_sync():
+            # Sources seen within RECENT_RATES_WINDOW come from a bounded timestamp range;
+            # only when there are none (e.g. after a long outage) is the whole pair scanned
+            cutoff = sqlite_timestamp(datetime.now(UTC) - RECENT_RATES_WINDOW)
+            sources = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT source_name FROM rates INDEXED BY idx_rates_timestamp WHERE timestamp > ? AND pair = ?",
+                (cutoff, pair)
+            )] or [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT source_name FROM rates WHERE pair = ?", (pair,)
+            )]
+            # Then one LIMITed probe of idx_rates_pair_source_timestamp per source
+            result = []
+            for source_name in sources:
+                result.extend(self.rows(self.conn.execute("""
+                    SELECT source_name, rate, timestamp
+                    FROM rates
+                    WHERE pair = ? AND source_name = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                """, (pair, source_name, per_source)), "timestamp"))
+            return result
+        return await self.run(fetch_sync)
+
+    async def fetch_rates_since(self, cutoff: datetime) -> list:
+        return await self.run(lambda: self.rows(self.conn.execute("""
+            SELECT source_name, pair, rate, timestamp
+            FROM rates
+            WHERE timestamp > ?
+            ORDER BY timestamp ASC
+        """, (sqlite_timestamp(cutoff),)), "timestamp"))
+
+    async def fetch_trends(
+        self, resolution: str, cutoff: datetime, source: Optional[str] = None, pair: str = DEFAULT_PAIR
+    ) -> list:
+        query = """
+            SELECT bucket AS timestamp, source_name, ROUND(rate_sum / sample_count, 4) AS rate
+            FROM rate_rollups
+            WHERE resolution = ? AND pair = ? AND bucket >= ?
+        """
+        params = [resolution, pair, sqlite_timestamp(cutoff)]
+        if source:
+            query += " AND source_name = ?"
+            params.append(source)
+        query += " ORDER BY bucket ASC"
+        return await self.run(lambda: self.rows(self.conn.execute(query, params), "timestamp"))
+
+    async def export_rates(
+        self, pair: str, start: datetime, end: datetime, sources: Optional[list], resolution: str, chunk_rows: int
+    ) -> AsyncIterator[list]:
+        if resolution == "raw":
+            query = "SELECT timestamp, source_name, rate FROM rates WHERE pair = ? AND timestamp >= ? AND timestamp < ?"
+        else:
+            query = """
+                SELECT bucket, source_name, ROUND(rate_sum / sample_count, 4)
+                FROM rate_rollups
+                WHERE pair = ? AND bucket >= ? AND bucket < ? AND resolution = ?
+            """
+        params = [pair, sqlite_timestamp(start), sqlite_timestamp(end)]
+        if resolution != "raw":
+            params.append(resolution)
+        if sources:
+            query += f" AND source_name IN ({', '.join('?' * len(sources))})"
+            params.extend(sources)
+        query += " ORDER BY 1, 2"
+
+        # A separate connection reads a consistent WAL snapshot without holding the write lock
+        conn = await asyncio.to_thread(sqlite3.connect, self.path, check_same_thread=False)
+        try:
+            cursor = await asyncio.to_thread(conn.execute, query, params)
+            while rows := await asyncio.to_thread(cursor.fetchmany, chunk_rows):
+                yield [
+                    (normalize_timestamp(datetime.fromisoformat(timestamp)), source_name, rate)
+                    for timestamp, source_name, rate in rows
+                ]
+        finally:
+            conn.close()
+
+    async def cleanup(self, cutoff: datetime):
+        def cleanup_sync():
+            rows = self.rows(self.conn.execute(
+                "SELECT timestamp, source_name, pair, rate FROM rates WHERE timestamp < ?",
+                (sqlite_timestamp(cutoff),)
+            ), "timestamp")
+            if rows:
+                write_archive_file(
+                    os.path.join(ARCHIVE_DIR, f"rates_until_{cutoff:%Y%m%d%H%M%S}.parquet"),
+                    [(r['timestamp'], r['source_name'], r['pair'], r['rate']) for r in rows]
+                )
+            with self.conn:
+                self.conn.execute("DELETE FROM rates WHERE timestamp < ?", (sqlite_timestamp(cutoff),))
+                # Daily rollups are tiny, so they outlive the raw data
+                self.conn.execute(
+                    "DELETE FROM rate_rollups WHERE resolution <> '1d' AND bucket < ?",
+                    (sqlite_timestamp(cutoff),)
+                )
+        await self.run(cleanup_sync)
+
+    async def get_subscription(self, endpoint: str):
+        rows = await self.run(lambda: self.rows(self.conn.execute("""
+            SELECT threshold, threshold_type, volatility_alert, pair
+            FROM subscriptions
+            WHERE endpoint = ?
+        """, (endpoint,))))
+        return rows[0] if rows else None
+
+    async def upsert_subscription(self, subscription: "AlertSubscription"):
+        def upsert_sync():
+            with self.conn:
+                self.conn.execute("""
+                    INSERT INTO subscriptions (endpoint, keys_json, threshold, threshold_type, volatility_alert, pair)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (endpoint) DO UPDATE SET
+                        keys_json = excluded.keys_json,
+                        threshold = excluded.threshold,
+                        threshold_type = excluded.threshold_type,
+                        volatility_alert = excluded.volatility_alert,
+                        pair = excluded.pair
+                """, (
+                    subscription.endpoint,
+                    json.dumps(subscription.keys),
+                    subscription.threshold,
+                    subscription.threshold_type,
+                    subscription.volatility_alert,
+                    subscription.pair
+                ))
+        await self.run(upsert_sync)
+
+    async def list_subscriptions(self) -> list:
+        rows = await self.run(lambda: self.rows(self.conn.execute(
+            "SELECT endpoint, threshold, threshold_type, volatility_alert, pair, created_at FROM subscriptions"
+        ), "created_at"))
+        for row in rows:
+            row['volatility_alert'] = bool(row['volatility_alert'])
+        return rows
+
+    async def fetch_threshold_subscriptions(self) -> list:
+        return await self.run(lambda: self.rows(self.conn.execute("""
+            SELECT endpoint, keys_json, threshold, threshold_type, pair
+            FROM subscriptions
+            WHERE threshold IS NOT NULL
+        """)))
+
+    async def delete_subscription(self, endpoint: str):
+        def delete_sync():
+            with self.conn:
+                self.conn.execute("DELETE FROM subscriptions WHERE endpoint = ?", (endpoint,))
+                self.conn.execute("DELETE FROM push_outbox WHERE endpoint = ?", (endpoint,))
+        await self.run(delete_sync)
+
+    async def clear_subscriptions(self):
+        def clear_sync():
+            with self.conn:
+                self.conn.execute("DELETE FROM subscriptions")
+                self.conn.execute("DELETE FROM push_outbox")
+        await self.run(clear_sync)
+
+    async def queue_threshold_alerts(self, notifications: list, endpoints: list):
+        def queue_sync():
+            now = sqlite_timestamp(datetime.now(UTC))
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO push_outbox (endpoint, keys_json, message, next_attempt_at) VALUES (?, ?, ?, ?)",
+                    [(*notification, now) for notification in notifications]
+                )
+                self.conn.executemany(
+                    "UPDATE subscriptions SET threshold = NULL WHERE endpoint = ?",
+                    [(endpoint,) for endpoint in endpoints]
+                )
+        await self.run(queue_sync)
+
+    async def queue_broadcast(self, message: str, volatility_only: bool = False, pair: Optional[str] = None) -> int:
+        def queue_sync():
+            with self.conn:
+                return self.conn.execute("""
+                    INSERT INTO push_outbox (endpoint, keys_json, message, next_attempt_at)
+                    SELECT endpoint, keys_json, ?1, ?2
+                    FROM subscriptions
+                    WHERE (volatility_alert OR NOT ?3) AND (?4 IS NULL OR pair = ?4)
+                """, (message, sqlite_timestamp(datetime.now(UTC)), volatility_only, pair)).rowcount
+        return await self.run(queue_sync)
+
+    async def fetch_due_notifications(self, limit: int) -> list:
+        return await self.run(lambda: self.rows(self.conn.execute("""
+            SELECT id, endpoint, keys_json, message, attempts
+            FROM push_outbox
+            WHERE next_attempt_at <= ?
+            ORDER BY id
+            LIMIT ?
+        """, (sqlite_timestamp(datetime.now(UTC)), limit))))
+
+    async def apply_delivery_results(
+        self, finished: list, gone: list, retries: list, deferred: list, defer_seconds: int
+    ):
+        def apply_sync():
+            now = datetime.now(UTC)
+            with self.conn:
+                self.conn.executemany("DELETE FROM push_outbox WHERE id = ?", [(i,) for i in finished])
+                self.conn.executemany("DELETE FROM push_outbox WHERE endpoint = ?", [(e,) for e in gone])
+                self.conn.executemany("DELETE FROM subscriptions WHERE endpoint = ?", [(e,) for e in gone])
+                self.conn.executemany("""
+                    UPDATE push_outbox
+                    SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                    WHERE id = ?
+                """, [
+                    (sqlite_timestamp(now + timedelta(seconds=delay)), error, i)
+                    for i, delay, error in retries
+                ])
+                self.conn.executemany(
+                    "UPDATE push_outbox SET next_attempt_at = ? WHERE id = ?",
+                    [(sqlite_timestamp(now + timedelta(seconds=defer_seconds)), i) for i in deferred]
+                )
+        await self.run(apply_sync)
+
+
+# Active storage backend (set up by init_database)
+storage: Optional[Storage] = None
+
+
+async def init_database():
+    """Initialize the configured storage backend."""
+    global storage
+    if STORAGE_BACKEND == "sqlite":
+        backend = SQLiteStorage(SQLITE_PATH)
+    elif not DATABASE_CONNSTR:
+        logger.error("DATABASE_CONNSTR not set")
+        return
+    else:
+        backend = PostgresStorage(DATABASE_CONNSTR)
+
+    await backend.init()
+    storage = backend
+    logger.info(f"Database initialized successfully ({backend.name})")
+
+
+def normalize_timestamp(timestamp: Optional[datetime] = None) -> datetime:
+    """Coerce a timestamp to timezone-aware UTC, defaulting to now."""
+    if timestamp is None:
+        return datetime.now(UTC)
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=UTC)
+    return timestamp.astimezone(UTC)
+
+
+async def save_rates(batch: list):
+    """Save a batch of (source_name, pair, rate, timestamp) rows in a single transaction.
+
+    Raw rows and their rollups are written together, so a scrape cycle or a
+    backfill costs one round-trip per table regardless of how many sources it
+    contains. timestamp may be None for "now".
+    """
+    if not batch:
+        return
+    try:
+        records = sorted(
+            (normalize_timestamp(timestamp), source_name, pair, float(rate))
+            for source_name, pair, rate, timestamp in batch
+        )
+        with SAVE_RATES_DURATION.time():
+            await storage.save_rates(records)
+        logger.info(f"Saved {len(records)} rates: " + ", ".join(f"{s} {p}={r}" for _, s, p, r in records))
+    except Exception as e:
+        logger.error(f"Failed to save batch of {len(batch)} rates: {e}")
+
+
+async def save_rate(
+    source_name: str, rate: float, timestamp: Optional[datetime] = None, pair: str = DEFAULT_PAIR
+):
+    """Save a rate to the database."""
+    await save_rates([(source_name, pair, rate, timestamp)])
+
+
+def rollup_bucket(timestamp: datetime, resolution: str) -> datetime:
+    """Return the start of the rollup bucket containing timestamp."""
+    step = ROLLUP_RESOLUTIONS[resolution]
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % step, UTC)
+
+
+def trend_resolution(days: int) -> str:
+    """Pick the coarsest rollup that keeps /rates/trends at a few hundred points per source."""
+    for resolution, max_days in ROLLUP_MAX_DAYS.items():
+        if days <= max_days:
+            return resolution
+    return "1d"
+
+
+def rollup_records(records: list) -> list:
+    """Expand (timestamp, source_name, pair, rate) records into (resolution, source_name, pair, bucket, rate, timestamp) rows."""
+    return [
+        (resolution, source_name, pair, rollup_bucket(timestamp, resolution), rate, timestamp)
+        for resolution in ROLLUP_RESOLUTIONS
+        for timestamp, source_name, pair, rate in records
+    ]
+
+
+def downsample_lttb(points: list, max_points: int) -> list:
+    """Downsample (epoch_seconds, rate, payload) points with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, for every bucket in between, the point
+    forming the largest triangle with the previously kept point and the average
+    of the next bucket, which preserves peaks and troughs of the series.
+    """
+    n = len(points)
+    if max_points >= n or max_points < 3:
+        return points
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (max_points - 2)
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / count
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / count
+
+        ax, ay = points[a][0], points[a][1]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def publish_latest_snapshot(rates: list, timestamp: datetime):
+    """Merge a batch of (source_name, pair, rate) triples into the latest-rate snapshot."""
+    global latest_snapshot, snapshot_version, snapshot_updated_at
+    if not rates:
+        return
+    snapshot = dict(latest_snapshot)
+    for source_name, pair, rate in rates:
+        snapshot[(source_name, pair)] = (rate, timestamp)
+    latest_snapshot = snapshot
+    snapshot_version += 1
+    snapshot_updated_at = timestamp
+
+
+# Most recent $1 rows per source of pair $2 newer than $3. The recursive CTE walks
+# distinct source names with one index probe each (a loose index scan) and the LATERAL
+# subquery reads the newest rows from idx_rates_pair_source_timestamp, so cost depends
+# on #sources, not table size. The $3 bound lets Postgres prune the daily partitions
+# down to the last few instead of probing every one of them.
+RECENT_RATES_WINDOW = timedelta(days=2)
+RECENT_RATES_PER_SOURCE_SQL = """
+    WITH RECURSIVE sources AS (
+        (SELECT source_name FROM rates WHERE pair = $2 AND timestamp > $3 ORDER BY source_name LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT r.source_name FROM rates r
+            WHERE r.pair = $2 AND r.timestamp > $3 AND r.source_name > s.source_name
+            ORDER BY r.source_name
+            LIMIT 1
+        )
+        FROM sources s
+        WHERE s.source_name IS NOT NULL
+    )
+    SELECT recent.source_name, recent.rate, recent.timestamp
+    FROM sources s
+    CROSS JOIN LATERAL (
+        SELECT r.source_name, r.rate, r.timestamp
+        FROM rates r
+        WHERE r.pair = $2 AND r.source_name = s.source_name AND r.timestamp > $3
+        ORDER BY r.timestamp DESC
+        LIMIT $1
+    ) recent
+"""
+
+
+async def fetch_latest_rates_from_db(pair: str = DEFAULT_PAIR) -> list:
+    """Query the most recent rate of pair for every source directly from the database."""
+    rows = await storage.fetch_recent_rates(1, pair)
+    return sorted(rows, key=itemgetter('rate'), reverse=True)
+
+
+def latest_rates_for(pair: str) -> list:
+    """Snapshot entries of pair as (source_name, rate, timestamp), best rate first."""
+    return sorted(
+        (
+            (source_name, rate, timestamp)
+            for (source_name, entry_pair), (rate, timestamp) in latest_snapshot.items()
+            if entry_pair == pair
+        ),
+        key=itemgetter(1),
+        reverse=True
+    )
+
+
+async def warm_latest_snapshot():
+    """Populate the latest-rate snapshot from the database at startup."""
+    global latest_snapshot, snapshot_version, snapshot_updated_at
+    try:
+        snapshot = {}
+        for pair in TRACKED_PAIRS:
+            for row in await fetch_latest_rates_from_db(pair):
+                snapshot[(row['source_name'], pair)] = (row['rate'], to_utc(row['timestamp']))
+        latest_snapshot = snapshot
+        snapshot_version += 1
+        if latest_snapshot:
+            snapshot_updated_at = max(ts for _, ts in latest_snapshot.values())
+        logger.info(f"Warmed latest-rate snapshot with {len(latest_snapshot)} source/pair entries")
+    except Exception as e:
+        logger.error(f"Failed to warm latest-rate snapshot: {e}")
+
+
+def snapshot_event_id() -> str:
+    """SSE id of the current snapshot; BOOT_ID keeps ids from a previous process from matching."""
+    return f"{BOOT_ID}-{snapshot_version}"
+
+
+def snapshot_event() -> str:
+    """Serialize the current latest-rate snapshot as a server-sent event."""
+    payload = json.dumps({
+        "version": snapshot_version,
+        "rates": [
+            {"source_name": source_name, "pair": pair, "rate": rate, "timestamp": timestamp.isoformat()}
+            for (source_name, pair), (rate, timestamp) in sorted(
+                latest_snapshot.items(), key=lambda item: (item[0][1], -item[1][0])
+            )
+        ]
+    })
+    return f"id: {snapshot_event_id()}\nevent: rates\ndata: {payload}\n\n"
+
+
+def broadcast_snapshot():
+    """Fan out the current snapshot to every /rates/stream subscriber.
+
+    The event is serialized once and shared by all queues. Slow consumers
+    drop their oldest pending event rather than growing without bound.
+    """
+    if not stream_subscribers:
+        return
+    event = snapshot_event()
+    for queue in stream_subscribers:
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(event)
+
+
+def not_modified(request: Request, response: Response) -> Optional[Response]:
+    """Attach scrape-generation validators and return a 304 if the client is up to date.
+
+    Rate data only changes when a scrape is published, so the snapshot version is
+    used as the ETag for every /rates/* representation.
+    """
+    if snapshot_version == 0:
+        return None
+
+    etag = f'W/"{BOOT_ID}-{snapshot_version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if snapshot_updated_at:
+        headers["Last-Modified"] = format_datetime(snapshot_updated_at.astimezone(UTC), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates or etag[2:] in candidates:
+            return Response(status_code=304, headers=headers)
+        return None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and snapshot_updated_at:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        if snapshot_updated_at.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=headers)
+    return None
+
+
+class VolatilityWindow:
+    """Sliding window of one source's rates for one pair over VOLATILITY_PERIOD_MINUTES.
+
+    Min/max come from monotonic deques and mean/stddev from running sums, so
+    adding a sample and evicting expired ones are amortized O(1).
+    """
+
+    def __init__(self):
+        self.samples: deque = deque()
+        self.min_queue: deque = deque()
+        self.max_queue: deque = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.ewma: Optional[float] = None
+        self.ewma_deviation = 0.0
+        self.volatile = False
+        self.last_alert_at: Optional[datetime] = None
+
+    def add(self, timestamp: datetime, rate: float):
+        self.samples.append((timestamp, rate))
+        self.total += rate
+        self.total_sq += rate * rate
+        while self.min_queue and self.min_queue[-1][1] >= rate:
+            self.min_queue.pop()
+        self.min_queue.append((timestamp, rate))
+        while self.max_queue and self.max_queue[-1][1] <= rate:
+            self.max_queue.pop()
+        self.max_queue.append((timestamp, rate))
+
+        # Deviation of the new sample from the smoothed trend, before folding it in
+        if self.ewma:
+            self.ewma_deviation = abs(rate - self.ewma) / self.ewma * 100
+            self.ewma = VOLATILITY_EWMA_ALPHA * rate + (1 - VOLATILITY_EWMA_ALPHA) * self.ewma
+        else:
+            self.ewma = rate
+
+    def evict(self, cutoff: datetime):
+        while self.samples and self.samples[0][0] <= cutoff:
+            _, rate = self.samples.popleft()
+            self.total -= rate
+            self.total_sq -= rate * rate
+        while self.min_queue and self.min_queue[0][0] <= cutoff:
+            self.min_queue.popleft()
+        while self.max_queue and self.max_queue[0][0] <= cutoff:
+            self.max_queue.popleft()
+
+    @property
+    def min_rate(self) -> float:
+        return self.min_queue[0][1]
+
+    @property
+    def max_rate(self) -> float:
+        return self.max_queue[0][1]
+
+    def metric(self) -> Optional[float]:
+        """Current volatility in percent according to VOLATILITY_METRIC."""
+        if not self.samples or self.min_rate <= 0:
+            return None
+        if VOLATILITY_METRIC == "stddev":
+            n = len(self.samples)
+            mean = self.total / n
+            variance = max(self.total_sq / n - mean * mean, 0.0)
+            return math.sqrt(variance) / mean * 100
+        if VOLATILITY_METRIC == "ewma":
+            return self.ewma_deviation
+        return (self.max_rate - self.min_rate) / self.min_rate * 100
+
+
+# Per-(source, pair) volatility windows, fed from each scrape batch
+volatility_windows: dict[tuple[str, str], VolatilityWindow] = {}
+
+
+def update_volatility(rates: list, timestamp: datetime):
+    """Add a batch of (source_name, pair, rate) triples to the volatility windows."""
+    for source_name, pair, rate in rates:
+        window = volatility_windows.get((source_name, pair))
+        if window is None:
+            window = volatility_windows[(source_name, pair)] = VolatilityWindow()
+        window.add(timestamp, rate)
+
+
+async def warm_volatility_windows():
+    """Rebuild the volatility windows from the last VOLATILITY_PERIOD_MINUTES of rates.
+
+    Sources that are already volatile are marked as such so a restart does not
+    re-alert on the same episode.
+    """
+    try:
+        cutoff = datetime.now(UTC) - timedelta(minutes=VOLATILITY_PERIOD_MINUTES)
+        result = await storage.fetch_rates_since(cutoff)
+
+        volatility_windows.clear()
+        for row in result:
+            update_volatility([(row['source_name'], row['pair'], row['rate'])], to_utc(row['timestamp']))
+        for window in volatility_windows.values():
+            metric = window.metric()
+            window.volatile = metric is not None and metric >= VOLATILITY_THRESHOLD
+        logger.info(f"Warmed volatility windows for {len(volatility_windows)} source/pair entries")
+    except Exception as e:
+        logger.error(f"Failed to warm volatility windows: {e}")
+
+
+async def check_volatility_alerts(now: Optional[datetime] = None):
+    """Check if rate volatility exceeds threshold.
+
+    Alerts are edge-triggered: a source notifies when it becomes volatile and
+    not again until it has calmed down and VOLATILITY_COOLDOWN_MINUTES passed.
+    """
+    try:
+        now = now or datetime.now(UTC)
+        cutoff = now - timedelta(minutes=VOLATILITY_PERIOD_MINUTES)
+        for key, window in list(volatility_windows.items()):
+            source_name, pair = key
+            window.evict(cutoff)
+            if not window.samples:
+                del volatility_windows[key]
+                continue
+
+            volatility = window.metric()
+            if volatility is None or volatility < VOLATILITY_THRESHOLD:
+                window.volatile = False
+                continue
+            if window.volatile:
+                continue
+            window.volatile = True
+
+            cooldown = timedelta(minutes=VOLATILITY_COOLDOWN_MINUTES)
+            if window.last_alert_at and now - window.last_alert_at < cooldown:
+                continue
+            window.last_alert_at = now
+
+            min_rate, max_rate = window.min_rate, window.max_rate
+            logger.warning(
+                f"Volatility alert for {source_name} {pair}: {volatility:.2f}% {VOLATILITY_METRIC} "
+                f"(min: {min_rate}, max: {max_rate})"
+            )
+            await send_volatility_notifications(source_name, volatility, min_rate, max_rate, pair)
+    except Exception as e:
+        logger.error(f"Failed to check volatility: {e}")
+
+
+async def maintain_rate_partitions():
+    """Create rates partitions RATES_PARTITIONS_AHEAD days ahead of time."""
+    try:
+        today = datetime.now(UTC).date()
+        await storage.maintain()
+        logger.info(f"Ensured rates partitions through {today + timedelta(days=RATES_PARTITIONS_AHEAD)}")
+    except Exception as e:
+        logger.error(f"Failed to create rates partitions: {e}")
+
+
+def write_archive_file(path: str, rows: list):
+    """Write (timestamp, source_name, pair, rate) rows to a zstd-compressed Parquet file.
+
+    Timestamps are stored as naive UTC. The file is written under a temporary
+    name and renamed, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    con = duckdb.connect()
+    try:
+        con.execute("CREATE TABLE archive (timestamp TIMESTAMP, source_name VARCHAR, pair VARCHAR, rate DOUBLE)")
+        con.executemany(
+            "INSERT INTO archive VALUES (?, ?, ?, ?)",
+            [
+                (ts.astimezone(UTC).replace(tzinfo=None), source_name, pair, rate)
+                for ts, source_name, pair, rate in rows
+            ]
+        )
+        con.execute(
+            f"COPY (SELECT * FROM archive ORDER BY pair, source_name, timestamp) TO '{tmp_path}' "
+            "(FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+
+
+async def archive_rows(conn: asyncpg.Connection, query: str, *args, path: str) -> int:
+    """Export the rows returned by query to a Parquet archive file."""
+    rows = await conn.fetch(query, *args)
+    if rows:
+        await asyncio.to_thread(
+            write_archive_file, path, [(r['timestamp'], r['source_name'], r['pair'], r['rate']) for r in rows]
+        )
+    return len(rows)
+
+
+async def drop_expired_partitions(conn: asyncpg.Connection, cutoff: datetime) -> list[str]:
+    """Archive, detach and drop daily partitions that lie entirely before cutoff.
+
+    Retention is day-granular: a partition goes once its whole day has expired.
+    A partition whose archive export fails is kept for the next run.
+    """
+    partitions = await conn.fetch("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'rates'::regclass
+    """)
+    dropped = []
+    for row in partitions:
+        match = re.fullmatch(r"rates_p(\d{8})", row['relname'])
+        if not match:
+            continue
+        day = datetime.strptime(match.group(1), "%Y%m%d").replace(tzinfo=UTC)
+        if day + timedelta(days=1) <= cutoff:
+            try:
+                await archive_rows(
+                    conn,
+                    f"SELECT timestamp, source_name, pair, rate FROM {row['relname']}",
+                    path=os.path.join(ARCHIVE_DIR, f"rates_{match.group(1)}.parquet")
+                )
+            except Exception as e:
+                logger.error(f"Failed to archive {row['relname']}, keeping it: {e}")
+                continue
+            await conn.execute(f"ALTER TABLE rates DETACH PARTITION {row['relname']}")
+            await conn.execute(f"DROP TABLE {row['relname']}")
+            dropped.append(row['relname'])
+    return dropped
+
+
+async def cleanup_old_data():
+    """Drop rate partitions older than retention period."""
+    try:
+        cutoff = datetime.now(UTC) - timedelta(days=DATA_RETENTION_DAYS)
+        await storage.cleanup(cutoff)
+        logger.info(f"Cleaned up old rate records (older than {DATA_RETENTION_DAYS} days)")
+    except Exception as e:
+        logger.error(f"Failed to cleanup old data: {e}")
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build the pooled keep-alive HTTP client used by every scraper."""
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        headers={"User-Agent": SCRAPER_USER_AGENT},
+        timeout=10.0
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use outside the app lifespan."""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = create_http_client()
+    return http_client
+
+
+# Rate extraction: precompiled byte patterns applied to the response stream
+# Plausible (low, high) per pair; extend with RATE_SANITY_RANGES="USD/MYR=4.0:5.0,..."
+RATE_SANITY_RANGES: dict[str, tuple[float, float]] = {
+    "SGD/MYR": (3.0, 4.0),
+}
+for _entry in filter(None, os.getenv("RATE_SANITY_RANGES", "").split(",")):
+    _pair, _bounds = _entry.split("=")
+    _low, _high = _bounds.split(":")
+    RATE_SANITY_RANGES[_pair.strip().upper()] = (float(_low), float(_high))
+EXTRACT_OVERLAP_BYTES = 1024  # carried between chunks so matches can straddle a boundary
+
+
+@dataclass(frozen=True)
+class RatePattern:
+    """A rate regex (rate in group 1) plus a literal every match contains.
+
+    The regex only runs within EXTRACT_OVERLAP_BYTES of the anchor's
+    occurrences, which are found with a plain substring search. Anchors are
+    matched in the case the page uses (currency codes are upper case) even
+    when the regex itself ignores case.
+    """
+    anchor: bytes
+    regex: re.Pattern
+
+    def search(self, buffer: bytes):
+        pos = buffer.find(self.anchor)
+        while pos >= 0:
+            match = self.regex.search(
+                buffer, max(0, pos - EXTRACT_OVERLAP_BYTES), pos + len(self.anchor) + EXTRACT_OVERLAP_BYTES
+            )
+            if match:
+                yield match
+                pos = buffer.find(self.anchor, max(pos + 1, match.end()))
+            else:
+                pos = buffer.find(self.anchor, pos + 1)
+
+
+@dataclass
+class RateExtractor:
+    """Precompiled patterns that pull one pair's rate out of a page.
+
+    The first pattern match inside the pair's sanity range wins. Fallback
+    regexes are only tried on the whole document once no pattern matched,
+    so extractors with fallbacks keep the body until the end.
+    """
+    patterns: list[RatePattern]
+    fallbacks: list[re.Pattern] = field(default_factory=list)
+    pair: str = LEGACY_PAIR
+
+    def validate(self, match: re.Match) -> Optional[float]:
+        try:
+            rate = float(match.group(1))
+        except ValueError:
+            return None
+        low, high = RATE_SANITY_RANGES.get(self.pair, (0.0, math.inf))
+        return rate if low < rate < high else None
+
+    def scanner(self) -> "RateScanner":
+        return RateScanner(self)
+
+    def extract(self, content: bytes) -> Optional[float]:
+        """Extract from a complete document."""
+        scanner = self.scanner()
+        rate = scanner.feed(content)
+        return rate if rate is not None else scanner.finish()
+
+
+class RateScanner:
+    """Incremental state of one RateExtractor over a chunked body."""
+
+    def __init__(self, extractor: RateExtractor):
+        self.extractor = extractor
+        self.tail = b""
+        self.chunks: list[bytes] = []
+
+    def feed(self, chunk: bytes) -> Optional[float]:
+        """Scan the next chunk, returning the rate as soon as a pattern validates."""
+        if self.extractor.fallbacks:
+            self.chunks.append(chunk)
+        buffer = self.tail + chunk
+        for pattern in self.extractor.patterns:
+            for match in pattern.search(buffer):
+                rate = self.extractor.validate(match)
+                if rate is not None:
+                    return rate
+        self.tail = buffer[-EXTRACT_OVERLAP_BYTES:]
+        return None
+
+    def finish(self) -> Optional[float]:
+        """Try the fallbacks once the whole body has been seen."""
+        content = b"".join(self.chunks)
+        for regex in self.extractor.fallbacks:
+            for match in regex.finditer(content):
+                rate = self.extractor.validate(match)
+                if rate is not None:
+                    return rate
+        return None
+
+
+# Currency names as XE spells them in "X.XX <name>s"
+CURRENCY_NAMES = {
+    "MYR": "Malaysian Ringgit",
+    "SGD": "Singapore Dollar",
+    "USD": "US Dollar",
+    "EUR": "Euro",
+    "GBP": "British Pound",
+    "AUD": "Australian Dollar",
+    "IDR": "Indonesian Rupiah",
+    "THB": "Thai Baht",
+    "PHP": "Philippine Peso",
+    "INR": "Indian Rupee",
+}
+
+
+def xe_extractor(base: str, quote: str) -> RateExtractor:
+    b, q = base.encode(), quote.encode()
+    patterns = []
+    name = CURRENCY_NAMES.get(quote)
+    if name:
+        # "X.XXXX Malaysian Ringgits"
+        words = name.encode().split()
+        patterns.append(RatePattern(
+            words[0], re.compile(rb'(\d+\.\d{2,})\s*' + rb'\s*'.join(map(re.escape, words)), re.IGNORECASE)
+        ))
+    return RateExtractor(patterns + [
+        # Rate in fxrate class or data attributes
+        RatePattern(b"fxrate", re.compile(rb'class="[^"]*fxrate[^"]*"[^>]*>(\d+\.\d+)', re.IGNORECASE)),
+        # "1 SGD = X.XX MYR"
+        RatePattern(b, re.compile(rb'1\s*%s\s*=\s*(\d+\.?\d*)\s*%s' % (b, q), re.IGNORECASE)),
+    ], pair=f"{base}/{quote}")
+
+
+def wise_extractor(base: str, quote: str) -> RateExtractor:
+    b, q = base.encode(), quote.encode()
+    return RateExtractor([
+        # "S$1 SGD = X.XXX MYR" or "1 SGD = X.XXXX MYR"
+        RatePattern(b, re.compile(rb'1\s*%s\s*=\s*(\d+\.?\d*)\s*%s' % (b, q), re.IGNORECASE)),
+        # Table cells "X.XX MYR" shortly after "1 SGD"
+        RatePattern(q, re.compile(rb'>\s*1\s*%s\s*<.{0,512}?>\s*(\d+\.?\d*)\s*%s\s*<' % (b, q), re.IGNORECASE | re.DOTALL)),
+    ], pair=f"{base}/{quote}")
+
+
+def cimb_extractor(base: str, quote: str) -> RateExtractor:
+    pair = f"{base}/{quote}"
+    return RateExtractor([
+        # Hidden input holding a JSON array like value="[3.1107]"
+        RatePattern(b"rateList", re.compile(rb'rateList"\s*value="\[(\d+\.?\d*)\]"')),
+        # "SGD 1.00 = MYR X.XXXX"
+        RatePattern(quote.encode(), re.compile(rb'%s\s*1\.00\s*=\s*%s\s*(\d+\.?\d*)' % (base.encode(), quote.encode()), re.IGNORECASE)),
+    ], fallbacks=[
+        # Any standalone 4-decimal number inside the sanity range; without a range it would match anything
+        re.compile(rb'[\s>"\[](\d\.\d{4})[\s<"\]]'),
+    ] if pair in RATE_SANITY_RANGES else [], pair=pair)
+
+
+EXTRACTOR_FACTORIES: dict[str, Callable[[str, str], RateExtractor]] = {
+    "XE": xe_extractor,
+    "Wise": wise_extractor,
+    "CIMB": cimb_extractor,
+}
+
+# Compiled extractors, keyed by (source, pair)
+EXTRACTORS: dict[tuple[str, str], RateExtractor] = {}
+
+
+def extractor_for(source: str, pair: str) -> RateExtractor:
+    """Return the source's extractor for pair, compiling it on first use."""
+    extractor = EXTRACTORS.get((source, pair))
+    if extractor is None:
+        extractor = EXTRACTORS[(source, pair)] = EXTRACTOR_FACTORIES[source](*split_pair(pair))
+    return extractor
+
+
+# Conditional fetching: per-(source, url) validators from the last successfully parsed page
+PAGE_REGION_BYTES = int(os.getenv("PAGE_REGION_BYTES", 4096))
+
+
+@dataclass
+class PageValidators:
+    """What we know about a source's last parsed response."""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_hash: Optional[bytes] = None
+    rates: dict[str, float] = field(default_factory=dict)
+
+
+page_validators: dict[tuple[str, str], PageValidators] = {}
+
+
+class BodyRegionHasher:
+    """Incrementally hash the PAGE_REGION_BYTES following marker, or the whole body if it is absent.
+
+    Hashing only the region around the rate keeps rotating nonces and
+    timestamps elsewhere in the page from defeating the comparison. The
+    marker must come before the rate, or rate changes go unnoticed.
+    """
+
+    def __init__(self, marker: Optional[bytes] = None):
+        self.marker = marker
+        self.body = hashlib.blake2b(digest_size=16)
+        self.region = hashlib.blake2b(digest_size=16)
+        self.pending = b""
+        self.remaining: Optional[int] = None  # bytes left to hash once the marker is found
+        self.digest: Optional[bytes] = None
+
+    def feed(self, chunk: bytes):
+        if self.digest is not None:
+            return
+        if self.remaining is None:
+            self.body.update(chunk)
+            if not self.marker:
+                return
+            buffer = self.pending + chunk
+            start = buffer.find(self.marker)
+            if start < 0:
+                self.pending = buffer[len(buffer) - len(self.marker) + 1:]
+                return
+            chunk = buffer[start:]
+            self.remaining = PAGE_REGION_BYTES
+        piece = chunk[:self.remaining]
+        self.region.update(piece)
+        self.remaining -= len(piece)
+        if self.remaining == 0:
+            self.digest = self.region.digest()
+
+    def finish(self) -> bytes:
+        if self.digest is None:
+            self.digest = (self.body if self.remaining is None else self.region).digest()
+        return self.digest
+
+
+async def fetch_rates(
+    source: str,
+    url: str,
+    pairs: list[str],
+    client: Optional[httpx.AsyncClient] = None,
+    marker: Optional[bytes] = None,
+    **kwargs
+) -> dict[str, float]:
+    """Stream url through the source's extractor for each pair, skipping unchanged pages.
+
+    Sends If-None-Match/If-Modified-Since from the last parsed response; a 304,
+    or a body whose marker region hashes the same, returns the previous rates
+    so the source is still saved with a fresh timestamp. Any other non-200
+    status returns no rates. Otherwise the body is
+    scanned chunk by chunk and the download stops once every pair's rate is
+    found and the marker region has been hashed. Pairs without a rate are
+    left out of the result.
+    """
+    client = client or get_http_client()
+    scanners = {pair: extractor_for(source, pair).scanner() for pair in pairs}
+    cached = page_validators.get((source, url))
+    headers = {}
+    if cached:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    async with client.stream("GET", url, headers=headers, **kwargs) as response:
+        if response.status_code == 304 and cached:
+            logger.info(f"{source} not modified, reusing rates {cached.rates}")
+            return dict(cached.rates)
+        if response.status_code != 200:
+            # Error pages can still contain something that looks like a rate
+            logger.error(f"{source} returned HTTP {response.status_code} for {url}")
+            page_validators.pop((source, url), None)
+            return {}
+
+        hasher = BodyRegionHasher(marker)
+        rates = {}
+        unchanged = False
+        async for chunk in response.aiter_bytes():
+            hasher.feed(chunk)
+            if cached and hasher.digest is not None and hasher.digest == cached.body_hash:
+                unchanged = True
+                break
+            for pair, scanner in scanners.items():
+                if pair not in rates:
+                    rate = scanner.feed(chunk)
+                    if rate is not None:
+                        rates[pair] = rate
+            if len(rates) == len(scanners) and hasher.digest is not None:
+                break
+        else:
+            unchanged = cached is not None and hasher.finish() == cached.body_hash
+            for pair, scanner in scanners.items():
+                if pair not in rates:
+                    rate = scanner.finish()
+                    if rate is not None:
+                        rates[pair] = rate
+
+    if unchanged:
+        # Keep the new validators, or every later request revalidates against stale ones
+        cached.etag = response.headers.get("etag")
+        cached.last_modified = response.headers.get("last-modified")
+        logger.info(f"{source} unchanged, reusing rates {cached.rates}")
+        return dict(cached.rates)
+
+    if rates:
+        page_validators[(source, url)] = PageValidators(
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            body_hash=hasher.finish(),
+            rates=dict(rates)
+        )
+    else:
+        page_validators.pop((source, url), None)
+    return rates
+
+
+def pair_fields(pair: str) -> dict[str, str]:
+    """Placeholders available to per-pair URL and marker templates."""
+    base, quote = split_pair(pair)
+    return {
+        "base": base,
+        "quote": quote,
+        "base_lower": base.lower(),
+        "quote_lower": quote.lower(),
+    }
+
+
+async def scrape_per_pair(
+    source: str,
+    url_template: str,
+    pairs: list[str],
+    client: Optional[httpx.AsyncClient] = None,
+    marker_template: Optional[str] = None,
+    **kwargs
+) -> dict[str, float]:
+    """Fetch one page per pair concurrently for sources that only quote one pair per page."""
+    async def fetch_pair(pair: str) -> dict[str, float]:
+        fields = pair_fields(pair)
+        marker = marker_template.format(**fields).encode() if marker_template else None
+        return await fetch_rates(source, url_template.format(**fields), [pair], client, marker, **kwargs)
+
+    results = await asyncio.gather(*(fetch_pair(pair) for pair in pairs), return_exceptions=True)
+    rates = {}
+    for pair, result in zip(pairs, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to scrape {source} {pair} rate: {result}")
+        else:
+            rates.update(result)
+    return rates
 
 
-class TrendDataPoint(BaseModel):
-    timestamp: datetime
-    source_name: str
-    rate: float
+# Warm Playwright browser shared by browser-based scrapers (started lazily)
+BROWSER_RECYCLE_MINUTES = int(os.getenv("BROWSER_RECYCLE_MINUTES", 60))
+BROWSER_RECYCLE_USES = int(os.getenv("BROWSER_RECYCLE_USES", 200))
+BROWSER_SCRAPING_ENABLED = os.getenv("BROWSER_SCRAPING_ENABLED", "True").lower() == "true"
 
+playwright_instance = None
+browser = None
+browser_context = None
+browser_pages: dict = {}
+browser_started_at: Optional[datetime] = None
+browser_uses = 0
+browser_active_pages = 0
+browser_lock = asyncio.Lock()
 
-class AlertSubscription(BaseModel):
-    endpoint: str
-    keys: dict
-    threshold: Optional[float] = None
-    threshold_type: Optional[str] = "above"  # "above" or "below"
-    volatility_alert: bool = False
 
+async def start_browser():
+    """Launch Chromium and a stealth context to be reused across scrapes."""
+    global playwright_instance, browser, browser_context, browser_started_at, browser_uses
+    headless_mode = os.getenv("HEADLESS_SCRAPE", "True").lower() == "true"
+    if playwright_instance is None:
+        playwright_instance = await async_playwright().start()
+    browser = await playwright_instance.chromium.launch(
+        headless=headless_mode,
+        args=["--disable-blink-features=AutomationControlled", "--no-sandbox"]
+    )
+    browser_context = await new_browser_context()
+    browser_started_at = datetime.now(UTC)
+    browser_uses = 0
+    logger.info("Started warm Playwright browser")
 
-class ConversionRequest(BaseModel):
-    amount: float
-    source: Optional[str] = None
 
+async def new_browser_context():
+    """Create a stealth context on the running browser."""
+    context = await browser.new_context(
+        user_agent=SCRAPER_USER_AGENT,
+        viewport={'width': 1920, 'height': 1080}
+    )
+    await Stealth().apply_stealth_async(context)
+    return context
 
-class RateHistoryItem(BaseModel):
-    rate: float
-    timestamp: datetime
 
+async def close_browser():
+    """Close the shared browser; pages are recreated on next use."""
+    global browser, browser_context
+    browser_pages.clear()
+    if browser is not None:
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.error(f"Failed to close browser: {e}")
+    browser = None
+    browser_context = None
 
-class SourceHistory(BaseModel):
-    source_name: str
-    recent_rates: list[RateHistoryItem]
 
+async def stop_browser():
+    """Close the browser and the Playwright driver at shutdown."""
+    global playwright_instance
+    await close_browser()
+    if playwright_instance is not None:
+        await playwright_instance.stop()
+        playwright_instance = None
 
-class PushTestRequest(BaseModel):
-    endpoint: str
-    keys: dict
 
+def browser_needs_recycle() -> bool:
+    """Whether the browser is dead, too old or has served too many scrapes."""
+    if browser is None or not browser.is_connected():
+        return True
+    if browser_uses >= BROWSER_RECYCLE_USES:
+        return True
+    return datetime.now(UTC) - browser_started_at > timedelta(minutes=BROWSER_RECYCLE_MINUTES)
 
-# ... (existing code) ...
 
+@asynccontextmanager
+async def browser_page(name: str, own_context: bool = False):
+    """Yield a reusable page for a source, (re)starting the browser when needed.
 
-async def init_database():
-    """Initialize PostgreSQL tables."""
-    global db_pool
-    if not DATABASE_CONNSTR:
-        logger.error("DATABASE_CONNSTR not set")
-        return
+    With own_context the page gets a context of its own instead of the shared one,
+    so context-wide state such as tracing only covers this source. The browser is
+    only recycled while no other page is in use.
+    """
+    global browser_uses, browser_active_pages
+    async with browser_lock:
+        if browser_needs_recycle() and browser_active_pages == 0:
+            if browser is not None:
+                logger.info("Recycling Playwright browser")
+            await close_browser()
+            await start_browser()
+        page = browser_pages.get(name)
+        if page is None or page.is_closed():
+            context = await new_browser_context() if own_context else browser_context
+            page = await context.new_page()
+            browser_pages[name] = page
+        browser_uses += 1
+        browser_active_pages += 1
+    try:
+        yield page
+    except Exception:
+        # Drop the page so a broken one is not reused
+        browser_pages.pop(name, None)
+        try:
+            if own_context:
+                await page.context.close()
+            else:
+                await page.close()
+        except Exception:
+            pass
+        raise
+    finally:
+        browser_active_pages -= 1
 
-    db_pool = await asyncpg.create_pool(DATABASE_CONNSTR)
-    
-    async with db_pool.acquire() as conn:
-        # Create rates table
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS rates (
-                id SERIAL PRIMARY KEY,
-                timestamp TIMESTAMPTZ NOT NULL,
-                source_name VARCHAR NOT NULL,
-                rate DOUBLE PRECISION NOT NULL
-            )
-        """)
-
-        # Create subscriptions table
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                id SERIAL PRIMARY KEY,
-                endpoint VARCHAR UNIQUE NOT NULL,
-                keys_json VARCHAR NOT NULL,
-                threshold DOUBLE PRECISION,
-                threshold_type VARCHAR DEFAULT 'above',
-                volatility_alert BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
 
-        # Create indices
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_rates_timestamp ON rates(timestamp)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_rates_source ON rates(source_name)")
+# # Scraper Functions
+# Each scraper returns {pair: rate} for the tracked pairs it could get
+def tracked_pairs_with_base(*bases: str) -> list[str]:
+    """Tracked pairs whose base currency is one of bases."""
+    return [pair for pair in TRACKED_PAIRS if split_pair(pair)[0] in bases]
 
-    logger.info("Database initialized successfully")
 
+async def scrape_google_rate(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Scrape tracked pairs from Google Finance using the warm browser, one quote page at a time."""
+    rates = {}
+    for pair in TRACKED_PAIRS:
+        url = "https://www.google.com/finance/quote/{base}-{quote}".format(**pair_fields(pair))
+        try:
+            async with browser_page("Google") as page:
+                logger.info(f"Navigating to {url}...")
+                await page.goto(url)
+                await page.wait_for_selector('div[data-last-price]', timeout=5000)
+                rate = await page.locator('div[data-last-price]').get_attribute('data-last-price')
+                title = await page.title()
+                match = re.match(r"^(\S+) (\d+\.\d+)", title)
+                if match:
+                    rate = match.group(2)
+                rates[pair] = float(rate)
+        except Exception as e:
+            logger.error(f"Failed to scrape Google {pair} rate: {e}")
+    return rates
 
-async def save_rate(source_name: str, rate: float, timestamp: Optional[datetime] = None):
-    """Save a rate to the database."""
-    try:
-        # Use UTC timezone for storage
-        if timestamp is None:
-            timestamp = datetime.now(UTC)
-        elif timestamp.tzinfo is None:
-            timestamp = timestamp.replace(tzinfo=UTC)
-        else:
-            timestamp = timestamp.astimezone(UTC)
 
-        async with db_pool.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO rates (timestamp, source_name, rate)
-                VALUES ($1, $2, $3)
-                """,
-                timestamp, source_name, rate
-            )
-        logger.info(f"Saved rate for {source_name}: {rate}")
+async def scrape_revolut_rate(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Scrape SGD to MYR rate from Revolut using the warm browser.
+
+    The converter widget is matched on the "RM" symbol, so only SGD/MYR is supported.
+    """
+    url = "https://www.revolut.com/currency-converter/convert-sgd-to-myr-exchange-rate/"
+    try:
+        # A context of its own so the trace does not record concurrent Google scrapes
+        async with browser_page("Revolut", own_context=True) as page:
+            logger.info(f"Navigating to {url}...")
+            tracing = page.context.tracing
+            await tracing.start(screenshots=True, snapshots=True, sources=True)
+            trace_path = None
+            try:
+                await page.goto(url)
+                await page.wait_for_timeout(2000)
+                if await page.locator('span', has_text="Reject non-essential cookies").first.count() > 0:
+                    await page.locator('span', has_text="Reject non-essential cookies").first.click()
+                await page.locator('foreignObject span', has_text="RM").wait_for(state="visible", timeout=5000)
+                text = await page.locator('foreignObject span', has_text="RM").text_content()
+                text = text.replace('\xa0', ' ')
+                match = re.search(r'RM\s*([\d.]+)', text)
+                return {LEGACY_PAIR: float(match.group(1))} if match else {}
+            except Exception:
+                trace_path = "trace.zip"
+                try:
+                    inner_html = await page.evaluate("document.documentElement.innerHTML")
+                    with open("revolut_error.html", "w", encoding="utf-8") as f:
+                        f.write(inner_html)
+                except Exception as e:
+                    logger.error(f"Failed to save Revolut error page: {e}")
+                raise
+            finally:
+                # Always stop tracing, including on cancellation, so the next scrape can start it
+                try:
+                    await tracing.stop(path=trace_path)
+                except Exception as e:
+                    logger.error(f"Failed to stop Revolut trace: {e}")
     except Exception as e:
-        logger.error(f"Failed to save rate for {source_name}: {e}")
+        logger.error(f"Failed to scrape Revolut rate: {e}")
+    return {}
 
 
-async def check_volatility_alerts():
-    """Check if rate volatility exceeds threshold."""
+async def scrape_xe_rate(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Scrape tracked pairs from XE.com, one converter page per pair."""
     try:
-        cutoff = datetime.now(UTC) - timedelta(minutes=VOLATILITY_PERIOD_MINUTES)
-        async with db_pool.acquire() as conn:
-            result = await conn.fetch("""
-                SELECT source_name, MIN(rate) as min_rate, MAX(rate) as max_rate
-                FROM rates
-                WHERE timestamp > $1
-                GROUP BY source_name
-            """, cutoff)
-
-            for row in result:
-                source_name = row['source_name']
-                min_rate = row['min_rate']
-                max_rate = row['max_rate']
-                if min_rate > 0:
-                    volatility = ((max_rate - min_rate) / min_rate) * 100
-                    if volatility >= VOLATILITY_THRESHOLD:
-                        logger.warning(
-                            f"Volatility alert for {source_name}: {volatility:.2f}% "
-                            f"(min: {min_rate}, max: {max_rate})"
-                        )
-                        await send_volatility_notifications(source_name, volatility, min_rate, max_rate)
+        return await scrape_per_pair(
+            "XE",
+            "https://www.xe.com/currencyconverter/convert/?Amount=1&From={base}&To={quote}",
+            TRACKED_PAIRS,
+            client,
+            marker_template="result__BigRate"  # the rate element; the currency name follows the rate
+        )
     except Exception as e:
-        logger.error(f"Failed to check volatility: {e}")
+        logger.error(f"Failed to scrape XE rate: {e}")
+    return {}
 
 
-async def cleanup_old_data():
-    """Delete records older than retention period."""
+async def scrape_wise_rate(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Scrape tracked pairs from Wise, one converter page per pair."""
     try:
-        cutoff = datetime.now(UTC) - timedelta(days=DATA_RETENTION_DAYS)
-        async with db_pool.acquire() as conn:
-            await conn.execute(
-                "DELETE FROM rates WHERE timestamp < $1",
-                cutoff
-            )
-        logger.info(f"Cleaned up old rate records (older than {DATA_RETENTION_DAYS} days)")
+        return await scrape_per_pair(
+            "Wise",
+            "https://wise.com/gb/currency-converter/{base_lower}-to-{quote_lower}-rate?amount=1",
+            TRACKED_PAIRS,
+            client,
+            marker_template="1 {base} ="
+        )
     except Exception as e:
-        logger.error(f"Failed to cleanup old data: {e}")
+        logger.error(f"Failed to scrape Wise rate: {e}")
+    return {}
 
 
-# # Scraper Functions
-async def scrape_google_n_revolut_rate():
-    stealth = Stealth()
-    headless_mode = os.getenv("HEADLESS_SCRAPE", "True").lower() == "true"
-    # headless_mode = False
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=headless_mode, args=["--disable-blink-features=AutomationControlled", "--no-sandbox"])
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            viewport={'width': 1920, 'height': 1080}
-            )
-        await stealth.apply_stealth_async(context)
-        page_1 = await context.new_page()
-        page_2 = await context.new_page()
+async def scrape_cimb_rate(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Scrape SGD-based tracked pairs from CIMB (CIMB Singapore only quotes from SGD)."""
+    try:
+        return await scrape_per_pair(
+            "CIMB",
+            "https://www.cimbclicks.com.sg/sgd-to-{quote_lower}",
+            tracked_pairs_with_base("SGD"),
+            client,
+            marker_template="rateList",
+            follow_redirects=True
+        )
+    except Exception as e:
+        logger.error(f"Failed to scrape CIMB rate: {e}")
+    return {}
 
-        url = "https://www.google.com/finance/quote/SGD-MYR"
-        logger.info(f"Navigating to {url}...")
-        try:
-            await page_1.goto(url) #, wait_until="networkidle")
-            await page_1.wait_for_timeout(2000)
-            await page_1.wait_for_selector('div[data-last-price]', timeout=5000)
-            rate = await page_1.locator('div[data-last-price]').get_attribute('data-last-price')
-            title = await page_1.title()
-            match = re.match(r"^(\S+) (\d+\.\d+)", title)
-            # textarea = page_1.locator('textarea[name="q"]')
-            # await textarea.fill("sgd to myr")
-            # await textarea.press("Enter")
-            # locator = page_1.locator('span[data-name="Malaysian Ringgit"]')
-            # await locator.wait_for()
-            # text = await locator.text_content()
-            # print(text)
-            if match:
-                pair = match.group(1)
-                rate = float(match.group(2))
-            page_1_rate = float(rate)
-        except Exception as e:
-            logger.error(f"Failed to scrape Google rate: {e}")
-            page_1_rate = None
-        
-        url = "https://www.revolut.com/currency-converter/convert-sgd-to-myr-exchange-rate/"
-        logger.info(f"Navigating to {url}...")
-        await context.tracing.start(screenshots=True, snapshots=True, sources=True)
-        try:
-            await page_2.goto(url) #, wait_until="networkidle")
-            await page_2.wait_for_timeout(2000)
-            if await page_2.locator('span', has_text="Reject non-essential cookies").first.count() > 0:
-                await page_2.locator('span', has_text="Reject non-essential cookies").first.click()
-            # await page_2.locator('button[role="tab"]', has_text="1d").click()
-            await page_2.locator('foreignObject span', has_text="RM").wait_for(state="visible", timeout=5000)
-            text = await page_2.locator('foreignObject span', has_text="RM").text_content()
-            text = text.replace('\xa0', ' ')
-            match = re.search(r'RM\s*([\d.]+)', text)
-            if match:
-                page_2_rate = float(match.group(1))
-        except Exception as e:
-            # await page_2.screenshot(path="revolut_error.png", timeout=5000)
-            inner_html = await page_2.evaluate("document.documentElement.innerHTML")
-            with open("revolut_error.html", "w", encoding="utf-8") as f:
-                f.write(inner_html)
-            logger.error(f"Failed to scrape Revolut rate: {e}")
-            await context.tracing.stop(path="trace.zip")
-            page_2_rate = None
-        
-        await browser.close()
-        return [page_1_rate, page_2_rate]
 
+async def scrape_instarem_rate(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Scrape tracked pairs from Instarem's JSON API.
 
+    The API returns every quote currency for a base, so one request per base
+    currency fills all tracked pairs with that base.
+    """
+    client = client or get_http_client()
+
+    async def fetch_base(base: str, pairs: list[str]) -> dict[str, float]:
+        response = await client.get(f"https://www.instarem.com/wp-json/instarem/v2/convert-rate/{base.lower()}/")
+        rates = {}
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("status") and "data" in data:
+                for pair in pairs:
+                    rate = data["data"].get(split_pair(pair)[1])
+                    if rate is not None:
+                        rates[pair] = float(rate)
+        return rates
+
+    grouped = pairs_by_base(TRACKED_PAIRS)
+    results = await asyncio.gather(*(fetch_base(base, pairs) for base, pairs in grouped.items()), return_exceptions=True)
+    rates = {}
+    for base, result in zip(grouped, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to scrape Instarem {base} rates: {result}")
+        else:
+            rates.update(result)
+    return rates
 
-async def scrape_xe_rate() -> Optional[float]:
-    """Scrape SGD to MYR rate from XE.com."""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://www.xe.com/currencyconverter/convert/?Amount=1&From=SGD&To=MYR",
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                },
-                timeout=10.0
-            )
-            text = response.text
 
-            # Pattern 1: "X.XXXX Malaysian Ringgits"
-            match = re.search(r'(\d+\.\d{2,})\s*Malaysian\s*Ringgit', text, re.IGNORECASE)
-            if match:
-                rate = float(match.group(1))
-                if 3.0 < rate < 4.0:
-                    return rate
+async def scrape_exchangerate_api(client: Optional[httpx.AsyncClient] = None) -> dict[str, float]:
+    """Fallback: Use free exchange rate API, one request per base currency."""
+    client = client or get_http_client()
+    rates = {}
+    for base, pairs in pairs_by_base(TRACKED_PAIRS).items():
+        try:
+            response = await client.get(f"https://api.exchangerate-api.com/v4/latest/{base}")
+            if response.status_code == 200:
+                quotes = response.json().get("rates", {})
+                for pair in pairs:
+                    rate = quotes.get(split_pair(pair)[1])
+                    if rate:
+                        rates[pair] = rate
+        except Exception as e:
+            logger.error(f"Failed to get ExchangeRate API {base} rates: {e}")
+    return rates
 
-            # Pattern 2: Look for rate in fxrate class or data attributes
-            match = re.search(r'class="[^"]*fxrate[^"]*"[^>]*>(\d+\.\d+)', text, re.IGNORECASE)
-            if match:
-                rate = float(match.group(1))
-                if 3.0 < rate < 4.0:
-                    return rate
 
-            # Pattern 3: "1 SGD = X.XX MYR"
-            match = re.search(r'1\s*SGD\s*=\s*(\d+\.?\d*)\s*MYR', text, re.IGNORECASE)
-            if match:
-                rate = float(match.group(1))
-                if 3.0 < rate < 4.0:
-                    return rate
+# Scrape cycle latency budget and circuit breaker settings
+SCRAPE_CYCLE_DEADLINE = float(os.getenv("SCRAPE_CYCLE_DEADLINE", 8.0))  # seconds before a cycle saves what it has
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_COOLDOWN_MINUTES = float(os.getenv("CIRCUIT_COOLDOWN_MINUTES", 15))
 
-    except Exception as e:
-        logger.error(f"Failed to scrape XE rate: {e}")
-    return None
 
+@dataclass
+class CircuitBreaker:
+    """Skips a source for a cooldown after consecutive failures.
 
-async def scrape_wise_rate() -> Optional[float]:
-    """Scrape SGD to MYR rate from Wise."""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://wise.com/gb/currency-converter/sgd-to-myr-rate?amount=1",
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                },
-                timeout=10.0
-            )
-            text = response.text
+    Once the cooldown has passed a single trial run is let through
+    (half-open); success closes the circuit, failure re-opens it.
+    """
+    failures: int = 0
+    opened_at: Optional[float] = None
+    trial_running: bool = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= CIRCUIT_COOLDOWN_MINUTES * 60:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+
+@dataclass
+class ScraperConfig:
+    """A registered rate source and how it should be scheduled."""
+    name: str
+    scraper: Callable[[httpx.AsyncClient], Awaitable[dict[str, float]]]
+    interval: float = SCRAPE_INTERVAL  # minutes between runs
+    timeout: float = 15.0  # seconds before the run is abandoned
+    priority: int = 100  # lower runs first and wins ties
+    enabled: bool = True
+    hedge_after: Optional[float] = None  # seconds before a duplicate request is raced against a slow one
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+
+# Registered scrapers, keyed by source name
+SCRAPERS: dict[str, ScraperConfig] = {}
+
+
+def register_scraper(
+    name: str,
+    scraper: Callable[[httpx.AsyncClient], Awaitable[dict[str, float]]],
+    interval: Optional[float] = None,
+    timeout: float = 15.0,
+    priority: int = 100,
+    enabled: bool = True,
+    hedge_after: Optional[float] = None
+) -> ScraperConfig:
+    """Register a rate source.
+
+    Interval, timeout and enabled flag can be overridden per source with the
+    SCRAPE_INTERVAL_<NAME>, SCRAPE_TIMEOUT_<NAME> and SCRAPE_ENABLED_<NAME>
+    environment variables.
+    """
+    env_name = re.sub(r"[^A-Z0-9]", "_", name.upper())
+    interval = float(os.getenv(f"SCRAPE_INTERVAL_{env_name}", interval or SCRAPE_INTERVAL))
+    timeout = float(os.getenv(f"SCRAPE_TIMEOUT_{env_name}", timeout))
+    enabled = os.getenv(f"SCRAPE_ENABLED_{env_name}", str(enabled)).lower() == "true"
+    config = ScraperConfig(name, scraper, interval, timeout, priority, enabled, hedge_after)
+    SCRAPERS[name] = config
+    return config
+
+
+# Scrapers ordered by reliability (most reliable first)
+# HTTP sources get tight budgets and a hedged duplicate request when slow
+register_scraper("Instarem", scrape_instarem_rate, timeout=5.0, priority=10, hedge_after=1.5)   # JSON API - most reliable
+register_scraper("Wise", scrape_wise_rate, timeout=8.0, priority=20, hedge_after=2.5)           # Works well with regex
+register_scraper(
+    "CIMB", scrape_cimb_rate, timeout=8.0, priority=30, hedge_after=2.5,
+    enabled=bool(tracked_pairs_with_base("SGD"))
+)  # Rate in hidden input, SGD base only
+register_scraper("XE", scrape_xe_rate, timeout=8.0, priority=40, enabled=False, hedge_after=2.5)  # Reliable alternative
+# Browser-based sources share the warm Playwright browser
+register_scraper("Google", scrape_google_rate, timeout=30.0, priority=50, enabled=BROWSER_SCRAPING_ENABLED)
+register_scraper(
+    "Revolut", scrape_revolut_rate, timeout=30.0, priority=60,
+    enabled=BROWSER_SCRAPING_ENABLED and LEGACY_PAIR in TRACKED_PAIRS
+)  # Often returns 403, SGD/MYR only
+
+
+def enabled_scrapers() -> list[ScraperConfig]:
+    """Return enabled scrapers in priority order."""
+    return sorted(
+        (config for config in SCRAPERS.values() if config.enabled),
+        key=lambda config: config.priority
+    )
 
-            # Pattern 1: "S$1 SGD = X.XXX MYR" or "1 SGD = X.XXXX MYR"
-            match = re.search(r'1\s*SGD\s*=\s*(\d+\.?\d*)\s*MYR', text, re.IGNORECASE)
-            if match:
-                rate = float(match.group(1))
-                return rate
 
-            # Pattern 2: Look for rate in table cells "X.XX MYR" after "1 SGD"
-            match = re.search(r'>\s*1\s*SGD\s*<.*?>\s*(\d+\.?\d*)\s*MYR\s*<', text, re.IGNORECASE | re.DOTALL)
-            if match:
-                rate = float(match.group(1))
-                return rate
-    except Exception as e:
-        logger.error(f"Failed to scrape Wise rate: {e}")
-    return None
+def has_fresh_primary_rate(now: datetime) -> bool:
+    """Whether any enabled primary source has produced a rate within its own interval."""
+    snapshot = latest_snapshot
+    intervals = {config.name: config.interval for config in enabled_scrapers()}
+    for (source_name, _), (_, timestamp) in snapshot.items():
+        interval = intervals.get(source_name)
+        if interval is not None and now - timestamp <= timedelta(minutes=interval * 2):
+            return True
+    return False
+
 
+async def hedged_scrape(config: ScraperConfig, client: httpx.AsyncClient) -> dict[str, float]:
+    """Run the scraper, racing a second attempt if the first is slower than hedge_after."""
+    first = asyncio.ensure_future(config.scraper(client))
+    if config.hedge_after is None:
+        return await first
 
-async def scrape_cimb_rate() -> Optional[float]:
-    """Scrape SGD to MYR rate from CIMB."""
+    attempts = [first]
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://www.cimbclicks.com.sg/sgd-to-myr",
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                },
-                timeout=10.0,
-                follow_redirects=True
-            )
-            text = response.text
+        done, _ = await asyncio.wait(attempts, timeout=config.hedge_after)
+        if not done:
+            logger.info(f"Scraper {config.name} slower than {config.hedge_after}s, sending hedged request")
+            attempts.append(asyncio.ensure_future(config.scraper(client)))
+        # Take the first attempt that produces rates
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result():
+                    return task.result()
+        return first.result()
+    finally:
+        for task in attempts:
+            task.cancel()
+
+
+async def run_scraper(config: ScraperConfig, client: httpx.AsyncClient) -> dict[str, float]:
+    """Run a single scraper within its timeout, recording the outcome on its circuit breaker and metrics."""
+    failed = True
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        rates = await asyncio.wait_for(hedged_scrape(config, client), timeout=config.timeout)
+        failed = not rates
+        outcome = "empty" if failed else "success"
+        return rates
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        SCRAPER_DURATION.labels(config.name).observe(time.perf_counter() - start)
+        SCRAPER_RUNS.labels(config.name, outcome).inc()
+        if failed:
+            was_open = config.breaker.opened_at is not None
+            config.breaker.record_failure()
+            if not was_open and config.breaker.opened_at is not None:
+                logger.warning(f"Circuit opened for {config.name}, skipping it for {CIRCUIT_COOLDOWN_MINUTES} minutes")
+        else:
+            config.breaker.record_success()
 
-            # Pattern 1: Rate stored in hidden input as JSON array like value="[3.1107]"
-            match = re.search(r'rateList"\s*value="\[(\d+\.?\d*)\]"', text)
-            if match:
-                rate = float(match.group(1))
-                return rate
 
-            # Pattern 2: "SGD 1.00 = MYR X.XXXX"
-            match = re.search(r'SGD\s*1\.00\s*=\s*MYR\s*(\d+\.?\d*)', text, re.IGNORECASE)
-            if match:
-                rate = float(match.group(1))
-                return rate
+def collect_results(configs: list[ScraperConfig], tasks: list[asyncio.Task]) -> list:
+    """Turn finished scraper tasks into (source_name, pair, rate) triples, logging failures."""
+    rates_collected = []
+    for config, task in zip(configs, tasks):
+        error = task.exception()
+        if isinstance(error, asyncio.TimeoutError):
+            logger.error(f"Scraper {config.name} timed out after {config.timeout}s")
+        elif error is not None:
+            logger.error(f"Scraper {config.name} raised exception: {error}")
+        elif task.result():
+            rates_collected.extend((config.name, pair, rate) for pair, rate in task.result().items())
+        else:
+            logger.warning(f"No rate obtained from {config.name}")
+    return rates_collected
 
-            # Pattern 3: Any rate value between 3.0 and 4.0 (SGD/MYR typical range)
-            matches = re.findall(r'(\d+\.\d{4})', text)
-            for match_str in matches:
-                rate = float(match_str)
-                return rate
 
-    except Exception as e:
-        logger.error(f"Failed to scrape CIMB rate: {e}")
-    return None
+async def process_rates(rates_collected: list, now_utc: datetime):
+    """Save a batch of scraped rates, publish it and run alert checks."""
+    # Persist the whole batch in one transaction
+    await save_rates([(source_name, pair, rate, now_utc) for source_name, pair, rate in rates_collected])
 
+    # Publish the new batch so /rates/latest can be served from memory
+    publish_latest_snapshot(rates_collected, now_utc)
+    if rates_collected:
+        broadcast_snapshot()
 
-async def scrape_instarem_rate() -> Optional[float]:
-    """Scrape SGD to MYR rate from Instarem using their JSON API."""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://www.instarem.com/wp-json/instarem/v2/convert-rate/sgd/",
-                headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                },
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") and "data" in data:
-                    rate = data["data"].get("MYR")
-                    return float(rate)
-    except Exception as e:
-        logger.error(f"Failed to scrape Instarem rate: {e}")
-    return None
+    # Check for volatility alerts
+    update_volatility(rates_collected, now_utc)
+    with ALERT_CHECK_DURATION.labels("volatility").time():
+        await check_volatility_alerts(now_utc)
+
+    # Check threshold alerts
+    with ALERT_CHECK_DURATION.labels("threshold").time():
+        await check_threshold_alerts(rates_collected)
 
 
-async def scrape_exchangerate_api() -> Optional[float]:
-    """Fallback: Use free exchange rate API."""
+async def process_late_results(configs: list[ScraperConfig], tasks: list[asyncio.Task]):
+    """Wait for scrapers that missed the cycle deadline and process them as their own batch."""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.exchangerate-api.com/v4/latest/SGD",
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("rates", {}).get("MYR")
+        await asyncio.wait(tasks)
+        rates_collected = collect_results(configs, tasks)
+        if rates_collected:
+            await process_rates(rates_collected, datetime.now(UTC))
+        logger.info(f"Late scrapers complete. Collected {len(rates_collected)} rates.")
     except Exception as e:
-        logger.error(f"Failed to get ExchangeRate API rate: {e}")
-    return None
-
+        logger.error(f"Failed to process late scraper results: {e}")
 
-async def scrape_all_rates():
-    """Scrape rates from all sources and save to database."""
-    logger.info("Starting rate scraping...")
-
-    # Define scrapers with their source names
-    # Scrapers ordered by reliability (most reliable first)
-    scrapers = [
-        ("Instarem", scrape_instarem_rate),   # JSON API - most reliable
-        ("Wise", scrape_wise_rate),           # Works well with regex
-        ("CIMB", scrape_cimb_rate),           # Rate in hidden input
-        # ("XE", scrape_xe_rate),               # Reliable alternative
-        # ("Google", scrape_google_rate),       # Playwright-based, reliable but slower
-        # ("Revolut", scrape_revolut_rate),     # Often returns 403
-    ]
 
-    # Run all scrapers concurrently
-    tasks = [scraper() for _, scraper in scrapers]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+async def scrape_sources(configs: list[ScraperConfig]):
+    """Scrape the given sources, save the batch and run alert checks.
 
-    rates_collected = []
+    Results that arrive within SCRAPE_CYCLE_DEADLINE are saved together;
+    slower sources keep running and are saved when they finish, so the cycle
+    is as fast as the fastest healthy sources. Sources with an open circuit
+    breaker are skipped.
+    """
+    allowed = []
+    for config in configs:
+        if config.breaker.allow():
+            allowed.append(config)
+        else:
+            SCRAPER_RUNS.labels(config.name, "skipped").inc()
+            logger.info(f"Skipping {config.name}: circuit open after {config.breaker.failures} failures")
+    cycle_start = time.perf_counter()
+    logger.info(f"Starting rate scraping for {', '.join(c.name for c in allowed) or 'no sources'}...")
+
+    # Run scrapers concurrently over the shared connection pool
+    client = get_http_client()
+    tasks = [asyncio.ensure_future(run_scraper(config, client)) for config in allowed]
+    if tasks:
+        await asyncio.wait(tasks, timeout=SCRAPE_CYCLE_DEADLINE)
+
+    done = [(config, task) for config, task in zip(allowed, tasks) if task.done()]
+    late = [(config, task) for config, task in zip(allowed, tasks) if not task.done()]
+    rates_collected = collect_results([c for c, _ in done], [t for _, t in done])
     # Use a single timestamp for all rates collected in this run
     now_utc = datetime.now(UTC)
 
-    for (source_name, _), result in zip(scrapers, results):
-        if isinstance(result, Exception):
-            logger.error(f"Scraper {source_name} raised exception: {result}")
-            continue
-        if result is not None:
-            await save_rate(source_name, result, timestamp=now_utc)
-            rates_collected.append((source_name, result))
-        else:
-            logger.warning(f"No rate obtained from {source_name}")
-
-    # Run combined Playwright scraper
-    # try:
-    #     playwright_rates = await scrape_google_n_revolut_rate()
-    #     # First result is Google
-    #     if playwright_rates[0] is not None:
-    #         await save_rate("Google", playwright_rates[0], timestamp=now_utc)
-    #         rates_collected.append(("Google", playwright_rates[0]))
-    #     else:
-    #         logger.warning("No rate obtained from Google")
-    #     # Second result is Revolut
-    #     if playwright_rates[1] is not None:
-    #         await save_rate("Revolut", playwright_rates[1], timestamp=now_utc)
-    #         rates_collected.append(("Revolut", playwright_rates[1]))
-    #     else:
-    #         logger.warning("No rate obtained from Revolut")    
-    # except Exception as e:
-    #     logger.error(f"Combined Playwright scraper raised exception: {e}")
-
-    # If no rates collected, use fallback
-    if not rates_collected:
+    if late:
+        logger.info(f"Cycle deadline reached, finishing {', '.join(c.name for c, _ in late)} in the background")
+        asyncio.create_task(process_late_results([c for c, _ in late], [t for _, t in late]))
+    # If no primary source has a recent rate, use fallback
+    elif not rates_collected and not has_fresh_primary_rate(now_utc):
         logger.warning("No rates collected from primary sources, using fallback API")
-        fallback_rate = await scrape_exchangerate_api()
-        if fallback_rate:
-            await save_rate("ExchangeRate-API", fallback_rate, timestamp=now_utc)
-            rates_collected.append(("ExchangeRate-API", fallback_rate))
-
-    # Check for volatility alerts
-    await check_volatility_alerts()
+        fallback_rates = await scrape_exchangerate_api(client)
+        rates_collected.extend(("ExchangeRate-API", pair, rate) for pair, rate in fallback_rates.items())
 
-    # Check threshold alerts
-    await check_threshold_alerts(rates_collected)
+    await process_rates(rates_collected, now_utc)
+    SCRAPE_CYCLE_DURATION.observe(time.perf_counter() - cycle_start)
 
     logger.info(f"Scraping complete. Collected {len(rates_collected)} rates.")
 
 
+async def scrape_source(name: str):
+    """Scheduler entry point for a single registered source."""
+    config = SCRAPERS.get(name)
+    if config and config.enabled:
+        await scrape_sources([config])
+
+
+async def scrape_all_rates():
+    """Scrape rates from all enabled sources and save to database."""
+    await scrape_sources(enabled_scrapers())
+
+
+def schedule_scrapers():
+    """Add one interval job per enabled source."""
+    for config in enabled_scrapers():
+        scheduler.add_job(
+            scrape_source,
+            "interval",
+            args=[config.name],
+            seconds=config.interval * 60,
+            id=f"scrape_{config.name}",
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+        logger.info(f"Scheduled {config.name} every {config.interval} minutes")
+
+
 # FastAPI App Setup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     # Startup
+    global http_client
+    http_client = create_http_client()
     await init_database()
+    if storage:
+        await warm_latest_snapshot()
+        await rebuild_threshold_index()
+        await warm_volatility_windows()
+
+    # Schedule one scraping job per registered source
+    schedule_scrapers()
 
-    # Schedule scraping job
+    # Schedule partition maintenance (daily, ahead of the next day's rows)
     scheduler.add_job(
-        scrape_all_rates,
-        "interval",
-        minutes=SCRAPE_INTERVAL,
-        id="scrape_rates",
+        maintain_rate_partitions,
+        "cron",
+        hour=12,
+        minute=0,
+        id="maintain_rate_partitions",
         replace_existing=True
     )
 
@@ -634,18 +2993,28 @@ async def lifespan(app: FastAPI):
         replace_existing=True
     )
 
+    scheduler.add_listener(record_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
     scheduler.start()
-    logger.info(f"Scheduler started. Scraping every {SCRAPE_INTERVAL} minutes.")
+    logger.info(f"Scheduler started with {len(enabled_scrapers())} scraper jobs.")
 
     # Run initial scrape
     asyncio.create_task(scrape_all_rates())
 
+    # Deliver queued push notifications in the background
+    outbox_task = asyncio.create_task(push_outbox_worker())
+    loop_monitor_task = asyncio.create_task(monitor_event_loop())
+
     yield
 
     # Shutdown
+    outbox_task.cancel()
+    loop_monitor_task.cancel()
     scheduler.shutdown()
-    if db_pool:
-        await db_pool.close()
+    await http_client.aclose()
+    await stop_browser()
+    push_executor.shutdown(wait=False)
+    if storage:
+        await storage.close()
     logger.info("Application shutdown complete.")
 
 
@@ -653,7 +3022,8 @@ app = FastAPI(
     title="SGD to MYR Rate Tracker",
     description="API for tracking SGD to MYR exchange rates from multiple sources",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -665,8 +3035,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# br when accepted, gzip otherwise; the SSE stream must not be buffered by a compressor,
+# and exports are streamed as-is (Parquet and Arrow are already zstd-compressed)
+app.add_middleware(
+    BrotliMiddleware,
+    quality=COMPRESSION_QUALITY,
+    minimum_size=COMPRESSION_MIN_BYTES,
+    excluded_handlers=["^/rates/stream$", "^/rates/export$"]
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Observe API latency per route template (not raw path, to keep label cardinality bounded)."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_DURATION.labels(
+        request.method, route.path if route else "unmatched", response.status_code
+    ).observe(time.perf_counter() - start)
+    return response
+
 
 # API Endpoints
+def require_tracked_pair(pair: str) -> str:
+    """Normalize a pair query parameter, rejecting pairs that are not tracked."""
+    pair = pair.upper()
+    if pair not in TRACKED_PAIRS:
+        raise HTTPException(status_code=400, detail=f"Untracked pair {pair}, expected one of {', '.join(TRACKED_PAIRS)}")
+    return pair
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API info."""
@@ -674,116 +3073,404 @@ async def root():
         "name": "SGD to MYR Rate Tracker API",
         "version": "1.0.0",
         "endpoints": {
+            "pairs": "/rates/pairs",
             "latest_rates": "/rates/latest",
             "trends": "/rates/trends",
-            "subscribe": "/alerts/subscribe"
+            "stream": "/rates/stream",
+            "archive": "/rates/archive",
+            "export": "/rates/export",
+            "subscribe": "/alerts/subscribe",
+            "metrics": "/metrics"
         }
     }
 
 
+@app.get("/rates/pairs")
+async def get_pairs():
+    """List the tracked currency pairs; the first one is the default."""
+    return {"default": DEFAULT_PAIR, "pairs": TRACKED_PAIRS}
+
+
 @app.get("/rates/latest", response_model=list[RateResponse])
-async def get_latest_rates():
-    """Get the most recent rate for all sources."""
+async def get_latest_rates(request: Request, response: Response, pair: str = DEFAULT_PAIR):
+    """Get the most recent rate of pair for all sources."""
+    pair = require_tracked_pair(pair)
+    cached = not_modified(request, response)
+    if cached:
+        return cached
+
+    rates = latest_rates_for(pair)
+    if rates:
+        return [
+            RateResponse(source_name=source_name, rate=rate, timestamp=timestamp, pair=pair)
+            for source_name, rate, timestamp in rates
+        ]
+
+    # Snapshot is cold (e.g. startup warm-up failed), fall back to the database
     try:
-        async with db_pool.acquire() as conn:
-            result = await conn.fetch("""
-                WITH latest AS (
-                    SELECT source_name, MAX(timestamp) as max_ts
-                    FROM rates
-                    GROUP BY source_name
-                )
-                SELECT r.source_name, r.rate, r.timestamp
-                FROM rates r
-                INNER JOIN latest l ON r.source_name = l.source_name AND r.timestamp = l.max_ts
-                ORDER BY r.rate DESC
-            """)
-
-            return [
-                RateResponse(source_name=row['source_name'], rate=row['rate'], timestamp=to_utc(row['timestamp']))
-                for row in result
-            ]
+        result = await fetch_latest_rates_from_db(pair)
+        return [
+            RateResponse(
+                source_name=row['source_name'], rate=row['rate'], timestamp=to_utc(row['timestamp']), pair=pair
+            )
+            for row in result
+        ]
     except Exception as e:
         logger.error(f"Failed to get latest rates: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve rates")
 
 
+@app.get("/rates/stream")
+async def stream_rates(request: Request):
+    """Push each new batch of latest rates as server-sent events.
+
+    Each stream ends after STREAM_MAX_SECONDS; the client reconnects with
+    Last-Event-ID and only gets the snapshot again if it changed meanwhile.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    if latest_snapshot and request.headers.get("last-event-id") != snapshot_event_id():
+        queue.put_nowait(snapshot_event())
+    stream_subscribers.add(queue)
+
+    async def event_generator():
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=min(STREAM_KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies from closing idle connections
+                    yield ": keepalive\n\n"
+        finally:
+            stream_subscribers.discard(queue)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/rates/trends")
-async def get_rate_trends(source: Optional[str] = None, days: int = 1):
-    """Get historical rate data for charting."""
+async def get_rate_trends(
+    request: Request,
+    response: Response,
+    source: Optional[str] = None,
+    days: int = 1,
+    max_points: Optional[int] = Query(None, ge=3),
+    pair: str = DEFAULT_PAIR,
+    layout: str = Query("rows", pattern="^(rows|columns)$"),
+    epoch_ms: bool = False
+):
+    """Get historical rate data of pair for charting.
+
+    layout=columns returns parallel timestamps/rates arrays per source instead
+    of one object per point; epoch_ms=true sends timestamps as epoch milliseconds.
+    """
+    pair = require_tracked_pair(pair)
+    cached = not_modified(request, response)
+    if cached:
+        return cached
+
     try:
-        cutoff = datetime.now(UTC) - timedelta(days=days)
+        resolution = trend_resolution(days)
+        cutoff = rollup_bucket(datetime.now(UTC) - timedelta(days=days), resolution)
 
-        async with db_pool.acquire() as conn:
-            if source:
-                result = await conn.fetch("""
-                    SELECT date_trunc('minute', timestamp) - 
-    (EXTRACT(minute FROM timestamp)::int % 5 || ' minutes')::interval  as timestamp, source_name, ROUND(rate::numeric, 4) as rate
-                    FROM rates
-                    WHERE timestamp > $1 AND source_name = $2
-                    ORDER BY timestamp ASC
-                """, cutoff, source)
-            else:
-                result = await conn.fetch("""
-                    SELECT date_trunc('minute', timestamp) - 
-    (EXTRACT(minute FROM timestamp)::int % 5 || ' minutes')::interval  as timestamp, source_name, ROUND(rate::numeric, 4) as rate
-                    FROM rates
-                    WHERE timestamp > $1
-                    ORDER BY timestamp ASC
-                """, cutoff)
+        result = await storage.fetch_trends(resolution, cutoff, source, pair)
 
         # Group by source for easier charting
-        trends = {}
+        series = {}
         for row in result:
-            timestamp = row['timestamp']
-            source_name = row['source_name']
-            rate = row['rate']
-            if source_name not in trends:
-                trends[source_name] = []
-            trends[source_name].append({
-                "timestamp": to_utc(timestamp).isoformat(),
-                "rate": rate
-            })
+            timestamp = to_utc(row['timestamp'])
+            series.setdefault(row['source_name'], []).append((timestamp.timestamp(), float(row['rate']), timestamp))
 
-        return {
+        trends = {}
+        for source_name, points in series.items():
+            if max_points:
+                points = downsample_lttb(points, max_points)
+            if epoch_ms:
+                timestamps = [int(epoch * 1000) for epoch, _, _ in points]
+            else:
+                timestamps = [timestamp for _, _, timestamp in points]
+            rates = [rate for _, rate, _ in points]
+            if layout == "columns":
+                trends[source_name] = {"timestamps": timestamps, "rates": rates}
+            else:
+                trends[source_name] = [{"timestamp": t, "rate": r} for t, r in zip(timestamps, rates)]
+
+        # Serialized straight to bytes by orjson (datetimes included), skipping jsonable_encoder
+        return ORJSONResponse({
+            "pair": pair,
             "period_days": days,
+            "resolution": resolution,
+            "layout": layout,
             "data": trends
-        }
+        }, headers=response.headers)
     except Exception as e:
         logger.error(f"Failed to get trends: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve trends")
 
 
+def archive_etag(end: date) -> str:
+    """ETag for /rates/archive from the archive files' names, sizes and mtimes.
+
+    The archive only changes when cleanup writes a file, which scrapes (and so
+    the snapshot version) say nothing about. end is included because it
+    defaults to today and is echoed in the response.
+    """
+    files = sorted(glob.glob(os.path.join(ARCHIVE_DIR, "*.parquet")))
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(end.isoformat().encode())
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Removed between the listing and the stat
+            continue
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def query_archive(
+    start: datetime, end: datetime, source: Optional[str], resolution: str, pair: str = DEFAULT_PAIR
+) -> list:
+    """Aggregate archived Parquet history of pair with DuckDB into (bucket, source_name, rate) rows.
+
+    Files written before rates carried a pair have no pair column; their rows
+    are all LEGACY_PAIR.
+    """
+    pattern = os.path.join(ARCHIVE_DIR, "*.parquet")
+    if not glob.glob(pattern):
+        return []
+    interval = "1 hour" if resolution == "1h" else "1 day"
+    con = duckdb.connect()
+    try:
+        columns = {row[0] for row in con.execute(
+            "DESCRIBE SELECT * FROM read_parquet(?, union_by_name = true)", [pattern]
+        ).fetchall()}
+        pair_column = f"COALESCE(pair, '{LEGACY_PAIR}')" if "pair" in columns else f"'{LEGACY_PAIR}'"
+        query = f"""
+            SELECT time_bucket(INTERVAL '{interval}', timestamp) AS bucket, source_name, ROUND(AVG(rate), 4) AS rate
+            FROM read_parquet(?, union_by_name = true)
+            WHERE timestamp >= ? AND timestamp < ? AND {pair_column} = ?
+        """
+        params = [
+            pattern, start.astimezone(UTC).replace(tzinfo=None), end.astimezone(UTC).replace(tzinfo=None), pair
+        ]
+        if source:
+            query += " AND source_name = ?"
+            params.append(source)
+        query += " GROUP BY bucket, source_name ORDER BY bucket"
+        return con.execute(query, params).fetchall()
+    finally:
+        con.close()
+
+
+@app.get("/rates/archive")
+async def get_rate_archive(
+    request: Request,
+    response: Response,
+    start: date,
+    end: Optional[date] = None,
+    source: Optional[str] = None,
+    resolution: str = Query("1d", pattern="^(1h|1d)$"),
+    pair: str = DEFAULT_PAIR
+):
+    """Get archived (expired) rate history from the Parquet archive for long-range charts."""
+    pair = require_tracked_pair(pair)
+    end = end or datetime.now(UTC).date()
+    etag = await asyncio.to_thread(archive_etag, end)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and ("*" in if_none_match or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    try:
+        start_dt = datetime.combine(start, datetime.min.time(), UTC)
+        end_dt = datetime.combine(end, datetime.min.time(), UTC) + timedelta(days=1)
+        result = await asyncio.to_thread(query_archive, start_dt, end_dt, source, resolution, pair)
+
+        archive = {}
+        for bucket, source_name, rate in result:
+            archive.setdefault(source_name, []).append({
+                "timestamp": bucket.replace(tzinfo=UTC).isoformat(),
+                "rate": rate
+            })
+
+        return {
+            "pair": pair,
+            "start": start.isoformat(),
+            "end": (end_dt - timedelta(days=1)).date().isoformat(),
+            "resolution": resolution,
+            "data": archive
+        }
+    except Exception as e:
+        logger.error(f"Failed to query archive: {e}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve archive")
+
+
+# Bulk export: column layout, and media type plus file extension per format
+EXPORT_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("source_name", pa.string()),
+    ("rate", pa.float64()),
+])
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportSink(io.RawIOBase):
+    """Write-only file that buffers what Arrow/Parquet writers emit until the response drains it."""
+
+    def __init__(self):
+        super().__init__()
+        self.pending: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.pending.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending = []
+        return data
+
+
+async def encode_export(chunks: AsyncIterator[list], export_format: str) -> AsyncIterator[bytes]:
+    """Encode (timestamp, source_name, rate) chunks as they arrive; Parquet gets a row group per chunk."""
+    if export_format == "csv":
+        yield b"timestamp,source_name,rate\r\n"
+        async for rows in chunks:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows((timestamp.isoformat(), source_name, rate) for timestamp, source_name, rate in rows)
+            yield buffer.getvalue().encode()
+        return
+
+    sink = ExportSink()
+    if export_format == "arrow":
+        writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+    else:
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression="zstd")
+    try:
+        async for rows in chunks:
+            timestamps, source_names, rates = zip(*rows)
+            writer.write_batch(pa.record_batch([
+                pa.array(timestamps, EXPORT_SCHEMA.field("timestamp").type),
+                pa.array(source_names, pa.string()),
+                pa.array(rates, pa.float64()),
+            ], schema=EXPORT_SCHEMA))
+            yield sink.drain()
+    finally:
+        # Writes the Arrow end-of-stream marker or the Parquet footer
+        writer.close()
+    yield sink.drain()
+
+
+export_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+@app.get("/rates/export")
+async def export_rates(
+    start: datetime,
+    end: Optional[datetime] = None,
+    source: Optional[list[str]] = Query(None),
+    pair: str = DEFAULT_PAIR,
+    resolution: str = Query("raw", pattern="^(raw|5m|1h|1d)$"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|arrow|parquet)$")
+):
+    """Stream rate history of pair in [start, end) as CSV, Arrow IPC or Parquet.
+
+    Rows are read and encoded EXPORT_CHUNK_ROWS at a time, so memory stays flat
+    for any range. Repeat source to pick several sources. Only history still
+    in the database is exported; expired rates live in /rates/archive. At most
+    EXPORT_MAX_CONCURRENT exports run at once; further requests get a 429.
+    """
+    pair = require_tracked_pair(pair)
+    start = normalize_timestamp(start)
+    end = normalize_timestamp(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if storage is None:
+        raise HTTPException(status_code=500, detail="Failed to export rates")
+    # Take the slot now (acquire cannot block once locked() is false) so concurrent
+    # requests cannot all pass the check before any of them starts streaming
+    if export_slots.locked():
+        raise HTTPException(status_code=429, detail="Too many exports in progress, try again later")
+    await export_slots.acquire()
+    released = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            export_slots.release()
+
+    async def body():
+        chunks = storage.export_rates(pair, start, end, source, resolution, EXPORT_CHUNK_ROWS)
+        try:
+            async for data in encode_export(chunks, export_format):
+                if data:
+                    yield data
+        except Exception as e:
+            # Headers are already sent; aborting the stream tells the client the file is incomplete
+            logger.error(f"Failed to export rates: {e}")
+            raise
+        finally:
+            release_slot()
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"rates_{pair.replace('/', '')}_{resolution}_{start:%Y%m%d}_{end:%Y%m%d}.{extension}"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        # Also frees the slot when the client disconnects before the body was started
+        background=BackgroundTask(release_slot)
+    )
+
+
 @app.get("/rates/history", response_model=list[SourceHistory])
-async def get_rate_history():
-    """Get the 5 most recent rates for each source."""
-    try:
-        async with db_pool.acquire() as conn:
-            result = await conn.fetch("""
-                SELECT source_name, rate, timestamp
-                FROM (
-                    SELECT source_name, rate, date_trunc('minute', timestamp) - 
-    (EXTRACT(minute FROM timestamp)::int % 5 || ' minutes')::interval as timestamp,
-                           ROW_NUMBER() OVER(PARTITION BY source_name ORDER BY timestamp DESC) as rn
-                    FROM rates
-                ) t
-                WHERE rn <= 5
-                ORDER BY source_name, timestamp DESC
-            """)
+async def get_rate_history(request: Request, response: Response, pair: str = DEFAULT_PAIR):
+    """Get the 5 most recent rates of pair for each source."""
+    pair = require_tracked_pair(pair)
+    cached = not_modified(request, response)
+    if cached:
+        return cached
 
-            sources = {}
-            for row in result:
-                source_name = row['source_name']
-                if source_name not in sources:
-                    sources[source_name] = []
-                sources[source_name].append(RateHistoryItem(
-                    rate=row['rate'],
-                    timestamp=to_utc(row['timestamp'])
-                ))
+    try:
+        result = await storage.fetch_recent_rates(5, pair)
 
-            return [
-                SourceHistory(source_name=name, recent_rates=rates)
-                for name, rates in sources.items()
-            ]
+        sources = {}
+        for row in sorted(result, key=lambda r: (r['source_name'], -to_utc(r['timestamp']).timestamp())):
+            source_name = row['source_name']
+            if source_name not in sources:
+                sources[source_name] = []
+            # Floor to the 5-minute scrape slot
+            timestamp = to_utc(row['timestamp'])
+            sources[source_name].append(RateHistoryItem(
+                rate=row['rate'],
+                timestamp=timestamp.replace(minute=timestamp.minute - timestamp.minute % 5, second=0, microsecond=0)
+            ))
+
+        return [
+            SourceHistory(source_name=name, recent_rates=rates)
+            for name, rates in sources.items()
+        ]
     except Exception as e:
         logger.error(f"Failed to get rate history: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve history")
@@ -793,21 +3480,18 @@ async def get_rate_history():
 async def get_alert_status(endpoint: str):
     """Get current subscription status."""
     try:
-        async with db_pool.acquire() as conn:
-            result = await conn.fetchrow("""
-                SELECT threshold, threshold_type, volatility_alert
-                FROM subscriptions
-                WHERE endpoint = $1
-            """, endpoint)
+        result = await storage.get_subscription(endpoint)
 
         if result:
             return {
                 "threshold": result['threshold'],
                 "threshold_type": result['threshold_type'],
                 "volatility_alert": bool(result['volatility_alert']),
-                "threshold_enabled": result['threshold'] is not None
+                "threshold_enabled": result['threshold'] is not None,
+                "pair": result['pair']
             }
         return {
+            "pair": DEFAULT_PAIR,
             "threshold": None,
             "threshold_type": "above",
             "volatility_alert": False,
@@ -822,31 +3506,23 @@ async def get_alert_status(endpoint: str):
 async def subscribe_alerts(subscription: AlertSubscription):
     """Subscribe to push notifications."""
     logger.info(f"Received subscription request for endpoint: {subscription.endpoint[:20]}...")
-    logger.info(f"Payload: threshold={subscription.threshold}, type={subscription.threshold_type}, vol={subscription.volatility_alert}")
-    
+    logger.info(f"Payload: pair={subscription.pair}, threshold={subscription.threshold}, type={subscription.threshold_type}, vol={subscription.volatility_alert}")
+    subscription.pair = require_tracked_pair(subscription.pair)
+
     try:
-        async with db_pool.acquire() as conn:
-            res = await conn.execute("""
-                INSERT INTO subscriptions (endpoint, keys_json, threshold, threshold_type, volatility_alert)
-                VALUES ($1, $2, $3, $4, $5)
-                ON CONFLICT (endpoint) DO UPDATE SET
-                    keys_json = EXCLUDED.keys_json,
-                    threshold = EXCLUDED.threshold,
-                    threshold_type = EXCLUDED.threshold_type,
-                    volatility_alert = EXCLUDED.volatility_alert
-            """, 
-            subscription.endpoint, 
+        await storage.upsert_subscription(subscription)
+        index_threshold(
+            subscription.endpoint,
             json.dumps(subscription.keys),
             subscription.threshold,
             subscription.threshold_type,
-            subscription.volatility_alert
-            )
-            logger.info(f"Subscription DB Result: {res}")
-            
-            # Verify immediately
-            check = await conn.fetchval("SELECT count(*) FROM subscriptions WHERE endpoint = $1", subscription.endpoint)
-            logger.info(f"Verification: Found {check} records for this endpoint.")
-            
+            subscription.pair
+        )
+
+        # Verify immediately
+        check = await storage.get_subscription(subscription.endpoint)
+        logger.info(f"Verification: Found {int(check is not None)} records for this endpoint.")
+
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Failed to subscribe: {e}")
@@ -856,9 +3532,8 @@ async def subscribe_alerts(subscription: AlertSubscription):
 async def get_all_subscriptions():
     """List all active subscriptions (Debug only)."""
     try:
-        async with db_pool.acquire() as conn:
-            rows = await conn.fetch("SELECT endpoint, threshold, threshold_type, volatility_alert, created_at FROM subscriptions")
-            return [dict(row) for row in rows]
+        rows = await storage.list_subscriptions()
+        return [dict(row) for row in rows]
     except Exception as e:
         logger.error(f"Failed to list subscriptions: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -867,8 +3542,8 @@ async def get_all_subscriptions():
 async def clear_all_subscriptions():
     """Clear all subscriptions from the database."""
     try:
-        async with db_pool.acquire() as conn:
-            await conn.execute("DELETE FROM subscriptions")
+        await storage.clear_subscriptions()
+        clear_threshold_index()
         logger.info("All subscriptions cleared from database")
         return {"status": "success", "message": "All subscriptions cleared"}
     except Exception as e:
@@ -883,8 +3558,8 @@ async def unsubscribe_alerts(request: dict):
         raise HTTPException(status_code=400, detail="Endpoint required")
     
     try:
-        async with db_pool.acquire() as conn:
-            await conn.execute("DELETE FROM subscriptions WHERE endpoint = $1", endpoint)
+        await storage.delete_subscription(endpoint)
+        unindex_threshold(endpoint)
         logger.info(f"Unsubscribed: {endpoint[:20]}...")
         return {"status": "success"}
     except Exception as e:
@@ -918,41 +3593,47 @@ async def send_test_alert(request: PushTestRequest):
 async def health_check():
     """Health check endpoint."""
     try:
-        async with db_pool.acquire() as conn:
-            await conn.fetchval("SELECT 1")
+        await storage.ping()
         return {
             "status": "healthy",
             "database": "connected",
-            "scheduler": "running" if scheduler.running else "stopped"
+            "scheduler": "running" if scheduler.running else "stopped",
+            "browser": "running" if browser is not None and browser.is_connected() else "idle",
+            "circuits": {name: config.breaker.state for name, config in SCRAPERS.items() if config.enabled}
         }
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Unhealthy: {e}")
     
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/debug/trigger-checks")
 async def trigger_checks():
     """Manually trigger alert checks for testing."""
     logger.info("Manually triggering alert checks")
     try:
-        # Check volatility
+        # Check volatility, rebuilding the windows from the DB (and resetting alert state)
+        # so rates inserted directly by test scripts are picked up
+        await warm_volatility_windows()
+        for window in volatility_windows.values():
+            window.volatile = False
         await check_volatility_alerts()
         
         # Check thresholds - we need recent rates for this.
         # We'll fetch the latest from DB to simulate "just scraped"
-        async with db_pool.acquire() as conn:
-             result = await conn.fetch("""
-                SELECT source_name, rate
-                FROM rates
-                WHERE timestamp > NOW() - INTERVAL '1 hour'
-                ORDER BY timestamp DESC
-             """)
-             # Dedup by source
-             seen = set()
-             rates = []
-             for row in result:
-                 if row['source_name'] not in seen:
-                     rates.append((row['source_name'], row['rate']))
-                     seen.add(row['source_name'])
-                     
+        result = await storage.fetch_rates_since(datetime.now(UTC) - timedelta(hours=1))
+        # Dedup by source and pair, keeping the newest rate
+        seen = set()
+        rates = []
+        for row in reversed(result):
+            key = (row['source_name'], row['pair'])
+            if key not in seen:
+                rates.append((row['source_name'], row['pair'], row['rate']))
+                seen.add(key)
+
         await check_threshold_alerts(rates)
         
         return {"status": "triggered", "rates_checked": len(rates)}
@@ -961,29 +3642,24 @@ async def trigger_checks():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.api_route("/debug/simulate-rate", methods=["GET", "POST"])
-async def simulate_rate(rate: float, source: str = "Simulation", force: bool = False):
+async def simulate_rate(rate: float, source: str = "Simulation", force: bool = False, pair: str = DEFAULT_PAIR):
     """Simulate a specific rate to trigger threshold alerts."""
-    logger.info(f"Simulating rate hit: {rate} from {source} (force={force})")
+    pair = require_tracked_pair(pair)
+    logger.info(f"Simulating rate hit: {pair} {rate} from {source} (force={force})")
     
     if force:
         # Debug: Send notification to EVERYONE regardless of their threshold settings
-        async with db_pool.acquire() as conn:
-            subscriptions = await conn.fetch("SELECT endpoint, keys_json FROM subscriptions")
-            for sub in subscriptions:
-                try:
-                    subscription_info = {"endpoint": sub['endpoint'], "keys": json.loads(sub['keys_json'])}
-                    message = json.dumps({
-                        "title": "FORCE ALERT TEST",
-                        "body": f"Simulated rate {rate} triggered! ⚡️",
-                        "icon": "/icons/icon-192x192.png"
-                    })
-                    await send_push_notification(subscription_info, message)
-                except Exception as e:
-                    logger.error(f"Force notify failed for {sub['endpoint'][:20]}: {e}")
-        return {"status": "Force simulation sent to all", "subs_count": len(subscriptions)}
-
-    await check_threshold_alerts([(source, rate)])
-    return {"status": "simulation triggered", "rate": rate, "source": source}
+        message = json.dumps({
+            "title": "FORCE ALERT TEST",
+            "body": f"Simulated rate {rate} triggered! ⚡️",
+            "icon": "/icons/icon-192x192.png"
+        })
+        queued = await storage.queue_broadcast(message)
+        push_outbox_wakeup.set()
+        return {"status": "Force simulation sent to all", "subs_count": queued}
+
+    await check_threshold_alerts([(source, pair, rate)])
+    return {"status": "simulation triggered", "rate": rate, "source": source, "pair": pair}
 
 @app.api_route("/debug/simulate-volatility", methods=["GET", "POST"])
 async def simulate_volatility(source: str = "Simulation", change: float = 2.5):
@@ -0,0 +1,118 @@
+"""SQLiteStorage round trips: raw rates, recent-rate lookups, rollups and schema migration."""
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# main reads its configuration at import time; keep the tests off Postgres, the browser and pushes
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("BROWSER_SCRAPING_ENABLED", "False")
+os.environ.setdefault("VAPID_PRIVATE_KEY", "")
+
+import main  # noqa: E402
+
+UTC = timezone.utc
+PAIR = main.LEGACY_PAIR
+
+
+@pytest.fixture
+def storage(tmp_path):
+    store = main.SQLiteStorage(str(tmp_path / "rates.db"))
+    asyncio.run(store.init())
+    yield store
+    asyncio.run(store.close())
+
+
+def rollup(store, resolution, source_name):
+    return store.conn.execute(
+        "SELECT open, high, low, close, rate_sum, sample_count FROM rate_rollups "
+        "WHERE resolution = ? AND source_name = ?",
+        (resolution, source_name)
+    ).fetchall()
+
+
+def test_fetch_recent_rates_returns_newest_per_source(storage):
+    now = datetime.now(UTC).replace(microsecond=0)
+    records = [
+        (now - timedelta(minutes=5 * i), source, PAIR, 3.0 + i / 100)
+        for source in ("Wise", "XE")
+        for i in range(8)
+    ]
+    records.append((now, "Wise", "USD/MYR", 4.5))
+    asyncio.run(storage.save_rates(records))
+
+    rows = asyncio.run(storage.fetch_recent_rates(3, PAIR))
+
+    by_source = {}
+    for row in rows:
+        by_source.setdefault(row["source_name"], []).append(row)
+    assert sorted(by_source) == ["Wise", "XE"]
+    for source_rows in by_source.values():
+        assert [row["timestamp"] for row in source_rows] == [now - timedelta(minutes=5 * i) for i in range(3)]
+        assert [row["rate"] for row in source_rows] == pytest.approx([3.0, 3.01, 3.02])
+
+
+def test_fetch_recent_rates_falls_back_to_old_rates(storage):
+    old = datetime.now(UTC) - main.RECENT_RATES_WINDOW - timedelta(days=5)
+    asyncio.run(storage.save_rates([(old, "CIMB", PAIR, 3.1)]))
+
+    rows = asyncio.run(storage.fetch_recent_rates(1, PAIR))
+
+    assert [(row["source_name"], row["rate"]) for row in rows] == [("CIMB", pytest.approx(3.1))]
+
+
+def test_rollups_keep_ohlc_for_out_of_order_rates(storage):
+    bucket = datetime(2026, 1, 5, 10, 0, tzinfo=UTC)
+    asyncio.run(storage.save_rates([(bucket + timedelta(minutes=30), "Wise", PAIR, 3.30)]))
+    # A backfilled older rate and a later one arrive after the first
+    asyncio.run(storage.save_rates([(bucket + timedelta(minutes=10), "Wise", PAIR, 3.10)]))
+    asyncio.run(storage.save_rates([(bucket + timedelta(minutes=50), "Wise", PAIR, 3.40)]))
+    asyncio.run(storage.save_rates([(bucket + timedelta(minutes=20), "Wise", PAIR, 3.20)]))
+
+    [(open_, high, low, close, rate_sum, sample_count)] = rollup(storage, "1h", "Wise")
+    assert (open_, high, low, close) == pytest.approx((3.10, 3.40, 3.10, 3.40))
+    assert (rate_sum, sample_count) == (pytest.approx(13.0), 4)
+    assert len(rollup(storage, "5m", "Wise")) == 4
+
+    trend = asyncio.run(storage.fetch_trends("1h", bucket - timedelta(hours=1), pair=PAIR))
+    assert [(row["timestamp"], row["source_name"], row["rate"]) for row in trend] == [
+        (bucket, "Wise", pytest.approx(3.25))
+    ]
+
+
+def test_init_migrates_rollups_without_open_and_close_times(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    bucket = "2026-01-05T00:00:00.000000+00:00"
+    conn = sqlite3.connect(path)
+    conn.executescript(f"""
+        CREATE TABLE rate_rollups (
+            resolution TEXT NOT NULL,
+            source_name TEXT NOT NULL,
+            pair TEXT NOT NULL DEFAULT '{PAIR}',
+            bucket TEXT NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            rate_sum REAL NOT NULL,
+            sample_count INTEGER NOT NULL,
+            PRIMARY KEY (resolution, pair, source_name, bucket)
+        );
+        INSERT INTO rate_rollups VALUES ('1d', 'XE', '{PAIR}', '{bucket}', 3.0, 3.2, 2.9, 3.1, 6.1, 2);
+    """)
+    conn.commit()
+    conn.close()
+
+    store = main.SQLiteStorage(path)
+    asyncio.run(store.init())
+    try:
+        asyncio.run(store.save_rates([(datetime(2026, 1, 5, 12, 0, tzinfo=UTC), "XE", PAIR, 3.5)]))
+        [(open_, high, low, close, rate_sum, sample_count)] = rollup(store, "1d", "XE")
+    finally:
+        asyncio.run(store.close())
+
+    # Legacy open/close count as being at the bucket start, so the new rate only moves close
+    assert (open_, high, low, close) == pytest.approx((3.0, 3.5, 2.9, 3.5))
+    assert (rate_sum, sample_count) == (pytest.approx(9.6), 3)
@@ -0,0 +1,262 @@
+"""Load benchmark for the rates API and the scrape cycle.
+
+Seeds a scratch database with DAYS x SOURCES of synthetic 5-minute rates,
+drives /rates/latest, /rates/history and /rates/trends in-process at the given
+concurrency, then runs scrape_all_rates against a local HTTP server serving
+fixture pages. Reports p50/p99 latency and throughput per scenario.
+
+    python bench_api.py --days 30 --sources 6 --concurrency 32 --requests 2000
+
+Uses a temporary SQLite database unless --dsn points at a scratch Postgres
+database (rows are added to it, so never point this at production).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+FIXTURE = os.path.join(BACKEND_DIR, "revolut_error.html")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=30, help="days of history to seed")
+    parser.add_argument("--sources", type=int, default=6, help="number of synthetic sources")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent API clients")
+    parser.add_argument("--requests", type=int, default=500, help="requests per API scenario")
+    parser.add_argument("--trend-days", default="1,7,14,30", help="comma-separated days for /rates/trends")
+    parser.add_argument("--scrape-cycles", type=int, default=20, help="scrape_all_rates runs")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="fake upstream delay in ms")
+    parser.add_argument("--dsn", help="scratch Postgres database to use instead of SQLite")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Point main at a scratch database and keep the scheduler, browser and pushes out of the way."""
+    if args.dsn:
+        os.environ["STORAGE_BACKEND"] = "postgres"
+        os.environ["DATABASE_CONNSTR"] = args.dsn
+    else:
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_api_"), "rates.db")
+    os.environ["BROWSER_SCRAPING_ENABLED"] = "False"
+    os.environ["SCRAPE_ENABLED_XE"] = "True"
+    os.environ["VAPID_PRIVATE_KEY"] = ""
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(name, latencies, errors, elapsed):
+    if not latencies:
+        print(f"{name:<28} no successful requests, {errors} errors")
+        return
+    print(
+        f"{name:<28} {len(latencies):>6} {errors:>6} {percentile(latencies, 0.5) * 1000:>9.2f} "
+        f"{percentile(latencies, 0.99) * 1000:>9.2f} {len(latencies) / elapsed:>10.1f}"
+    )
+
+
+async def seed(main, days, sources):
+    """Insert a seeded random walk every 5 minutes per source and pair, rollups included."""
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    steps = days * 24 * 12
+    total = 0
+    for pair in main.TRACKED_PAIRS:
+        low, high = main.RATE_SANITY_RANGES.get(pair, (1.0, 2.0))
+        for i in range(sources):
+            rate = (low + high) / 2
+            batch = []
+            for step in range(steps, 0, -1):
+                rate = min(high, max(low, rate + rng.gauss(0, 0.002)))
+                batch.append((now - timedelta(minutes=5 * step), f"Source{i + 1}", pair, round(rate, 4)))
+                if len(batch) == 5000:
+                    await main.storage.save_rates(batch)
+                    total += len(batch)
+                    batch = []
+            await main.storage.save_rates(batch)
+            total += len(batch)
+    return total
+
+
+async def drive(client, path, total, concurrency):
+    """Issue total GETs to path from concurrency workers, returning latencies, errors and wall time."""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def fixture_pages(main, page):
+    """Return body_for(host, path, query): each source's fixture page with the rate embedded near the end."""
+
+    def rate_for(pair):
+        low, high = main.RATE_SANITY_RANGES.get(pair, (1.0, 2.0))
+        return f"{(low + high) / 2:.4f}"
+
+    def body_for(host, path, query):
+        if "instarem" in host:
+            base = path.rstrip("/").rsplit("/", 1)[-1].upper()
+            quotes = {
+                main.split_pair(pair)[1]: rate_for(pair)
+                for pair in main.TRACKED_PAIRS if main.split_pair(pair)[0] == base
+            }
+            return "application/json", json.dumps({"status": True, "data": quotes}).encode()
+        if "wise" in host:
+            base, quote = path.rsplit("/", 1)[-1].removesuffix("-rate").upper().split("-TO-")
+            snippet = f"<span>1 {base} = {rate_for(f'{base}/{quote}')} {quote}</span>"
+        elif "xe.com" in host:
+            base, quote = query["From"][0], query["To"][0]
+            name = main.CURRENCY_NAMES.get(quote, quote)
+            snippet = f'<p class="result__BigRate">{rate_for(f"{base}/{quote}")} {name}s</p>'
+        elif "cimb" in host:
+            quote = path.rsplit("-", 1)[-1].upper()
+            snippet = f'<input type="hidden" id="rateList" value="[{rate_for(f"SGD/{quote}")}]">'
+        elif "exchangerate-api" in host:
+            base = path.rsplit("/", 1)[-1]
+            quotes = {
+                main.split_pair(pair)[1]: float(rate_for(pair))
+                for pair in main.TRACKED_PAIRS if main.split_pair(pair)[0] == base
+            }
+            return "application/json", json.dumps({"rates": quotes}).encode()
+        else:
+            return None, None
+        return "text/html", page + snippet.encode()
+
+    return body_for
+
+
+def start_fake_upstream(body_for, latency_ms):
+    """Serve fixture pages on a random local port, routing on the original Host header."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            content_type, body = body_for(self.headers.get("Host", ""), url.path, parse_qs(url.query))
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def bench_scrape(main, cycles, latency_ms):
+    import httpx
+
+    with open(FIXTURE, "rb") as f:
+        page = f.read()
+    server = start_fake_upstream(fixture_pages(main, page), latency_ms)
+    port = server.server_address[1]
+
+    class LocalTransport(httpx.AsyncHTTPTransport):
+        """Send every request to the fake upstream; the Host header still names the real site."""
+
+        async def handle_async_request(self, request):
+            request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=port)
+            return await super().handle_async_request(request)
+
+    main.http_client = httpx.AsyncClient(
+        transport=LocalTransport(limits=httpx.Limits(max_connections=main.HTTP_MAX_CONNECTIONS)),
+        headers={"User-Agent": main.SCRAPER_USER_AGENT}
+    )
+    latencies = []
+    start = time.perf_counter()
+    try:
+        for _ in range(cycles):
+            # Force full downloads and parses rather than conditional-fetch short-circuits
+            main.page_validators.clear()
+            cycle_start = time.perf_counter()
+            await main.scrape_all_rates()
+            latencies.append(time.perf_counter() - cycle_start)
+    finally:
+        await main.http_client.aclose()
+        server.shutdown()
+    return latencies, 0, time.perf_counter() - start
+
+
+async def run(args):
+    import httpx
+    import main
+
+    await main.init_database()
+    if main.storage is None:
+        sys.exit("Storage failed to initialize")
+    try:
+        start = time.perf_counter()
+        seeded = await seed(main, args.days, args.sources)
+        print(
+            f"--- API benchmark ({main.storage.name}, {seeded} rows seeded in {time.perf_counter() - start:.1f}s, "
+            f"concurrency {args.concurrency}) ---"
+        )
+        await main.warm_latest_snapshot()
+
+        print(f"{'scenario':<28} {'ok':>6} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>10}")
+        scenarios = ["/rates/latest", "/rates/history"] + [
+            f"/rates/trends?days={days.strip()}" for days in args.trend_days.split(",")
+        ]
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in scenarios:
+                await drive(client, path, args.concurrency, args.concurrency)  # warm-up
+                report(path, *await drive(client, path, args.requests, args.concurrency))
+
+        # Keep scrape log lines from drowning the report
+        main.logger.setLevel("WARNING")
+        scrape_start = datetime.now(timezone.utc)
+        report(f"scrape_all_rates x{args.scrape_cycles}", *await bench_scrape(main, args.scrape_cycles, args.upstream_latency))
+        scraped = sorted(
+            f"{source} {pair}" for (source, pair), (_, timestamp) in main.latest_snapshot.items()
+            if timestamp >= scrape_start
+        )
+        print(f"Scraped: {', '.join(scraped) or 'nothing (check the fixture pages)'}")
+    finally:
+        await main.storage.close()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure_environment(arguments)
+    asyncio.run(run(arguments))
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from main import LEGACY_PAIR, extractor_for  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "revolut_error.html")
+CHUNK_SIZE = 64 * 1024
+ROUNDS = 20
+
+# Rate snippets as each source renders them
+SNIPPETS = {
+    "XE": b'<p class="result__BigRate">3.1234 Malaysian Ringgits</p>',
+    "Wise": b'<span>1 SGD = 3.1234 MYR</span>',
+    "CIMB": b'<input type="hidden" id="rateList" value="[3.1234]">',
+}
+
+# The previous per-request approach: decode the whole body, then uncompiled re.search calls
+LEGACY_PATTERNS = {
+    "XE": [
+        (r'(\d+\.\d{2,})\s*Malaysian\s*Ringgit', re.IGNORECASE),
+        (r'class="[^"]*fxrate[^"]*"[^>]*>(\d+\.\d+)', re.IGNORECASE),
+        (r'1\s*SGD\s*=\s*(\d+\.?\d*)\s*MYR', re.IGNORECASE),
+    ],
+    "Wise": [
+        (r'1\s*SGD\s*=\s*(\d+\.?\d*)\s*MYR', re.IGNORECASE),
+        (r'>\s*1\s*SGD\s*<.*?>\s*(\d+\.?\d*)\s*MYR\s*<', re.IGNORECASE | re.DOTALL),
+    ],
+    "CIMB": [
+        (r'rateList"\s*value="\[(\d+\.?\d*)\]"', 0),
+        (r'SGD\s*1\.00\s*=\s*MYR\s*(\d+\.?\d*)', re.IGNORECASE),
+    ],
+}
+
+
+def legacy_extract(source, content):
+    text = content.decode("utf-8", errors="replace")
+    for pattern, flags in LEGACY_PATTERNS[source]:
+        match = re.search(pattern, text, flags)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def streaming_extract(source, content):
+    scanner = extractor_for(source, LEGACY_PAIR).scanner()
+    for i in range(0, len(content), CHUNK_SIZE):
+        rate = scanner.feed(content[i:i + CHUNK_SIZE])
+        if rate is not None:
+            return rate
+    return scanner.finish()
+
+
+def bench(fn, source, content):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        rate = fn(source, content)
+    return (time.perf_counter() - start) / ROUNDS * 1000, rate
+
+
+def main():
+    with open(FIXTURE, "rb") as f:
+        page = f.read()
+    print(f"--- Extractor benchmark ({len(page) / 1024:.0f} KiB fixture, {ROUNDS} rounds) ---")
+    print(f"{'source':<10} {'placement':<8} {'legacy ms':>10} {'stream ms':>10} {'speedup':>8}  rates")
+    for source, snippet in SNIPPETS.items():
+        # Rate near the top (typical) and at the very end (worst case for both)
+        for placement, content in (("head", page[:2048] + snippet + page[2048:]), ("tail", page + snippet)):
+            legacy_ms, legacy_rate = bench(legacy_extract, source, content)
+            stream_ms, stream_rate = bench(streaming_extract, source, content)
+            print(
+                f"{source:<10} {placement:<8} {legacy_ms:>10.2f} {stream_ms:>10.2f} "
+                f"{legacy_ms / stream_ms:>7.1f}x  {legacy_rate} / {stream_rate}"
+            )
+            assert stream_rate == 3.1234, f"{source} ({placement}) extracted {stream_rate}"
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,43 @@ import { useState, useEffect, useCallback } from "react";
 import { Rate, SourceHistory } from "@/types";
 
 const API_BASE = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+const PAIR = process.env.NEXT_PUBLIC_PAIR || "SGD/MYR";
+const HISTORY_LENGTH = 5;
+
+interface RatesEvent {
+  version: number;
+  rates: Array<Rate & { pair: string }>;
+}
+
+const SLOT_MS = 5 * 60 * 1000;
+
+// Floor to the 5-minute scrape slot, as /rates/history does
+function slotStart(timestamp: string): number {
+  return Math.floor(new Date(timestamp).getTime() / SLOT_MS) * SLOT_MS;
+}
+
+// Merge each published rate into its source's history with one entry per slot:
+// a rate in the newest slot replaces it, a rate in a later slot is prepended
+function mergeHistory(history: SourceHistory[], rates: Rate[]): SourceHistory[] {
+  const merged = history.map(h => ({ ...h, recent_rates: [...h.recent_rates] }));
+  rates.forEach(rate => {
+    let entry = merged.find(h => h.source_name === rate.source_name);
+    if (!entry) {
+      entry = { source_name: rate.source_name, recent_rates: [] };
+      merged.push(entry);
+    }
+    const slot = slotStart(rate.timestamp);
+    const item = { rate: rate.rate, timestamp: new Date(slot).toISOString() };
+    const newest = entry.recent_rates[0];
+    const newestSlot = newest ? slotStart(newest.timestamp) : -Infinity;
+    if (slot === newestSlot) {
+      entry.recent_rates[0] = item;
+    } else if (slot > newestSlot) {
+      entry.recent_rates = [item, ...entry.recent_rates].slice(0, HISTORY_LENGTH);
+    }
+  });
+  return merged;
+}
 
 export function useRates(pollInterval = 60000) {
   const [rates, setRates] = useState<Rate[]>([]);
@@ -13,51 +50,85 @@ export function useRates(pollInterval = 60000) {
   const [error, setError] = useState<string | null>(null);
   const [lastUpdated, setLastUpdated] = useState<Date | null>(null);
 
+  const applyLatest = useCallback((data: Rate[]) => {
+    if (data.length > 0) {
+      // Find the maximum timestamp across all latest rates to determine the "freshest" data point
+      const maxTimestamp = Math.max(...data.map(r => new Date(r.timestamp).getTime()));
+      const fiveMinutesInMs = 5 * 60 * 1000;
+
+      // Filter sources that are older than 5 minutes from the freshest update
+      const filteredRates = data.filter(rate => {
+        const rateTime = new Date(rate.timestamp).getTime();
+        return (maxTimestamp - rateTime) <= fiveMinutesInMs;
+      });
+
+      setRates(filteredRates);
+      setBestRate(filteredRates.length > 0 ? filteredRates[0] : data[0]);
+    } else {
+      setRates([]);
+      setBestRate(null);
+    }
+    setLastUpdated(new Date());
+    setError(null);
+  }, []);
+
   const fetchRates = useCallback(async () => {
+    // History is only refetched while the page is on screen; a hidden tab catches up when shown again
+    const withHistory = typeof document === "undefined" || document.visibilityState === "visible";
     try {
+      const pair = encodeURIComponent(PAIR);
       const [latestRes, historyRes] = await Promise.all([
-        fetch(`${API_BASE}/rates/latest?_t=${Date.now()}`, { cache: "no-store" }),
-        fetch(`${API_BASE}/rates/history?_t=${Date.now()}`, { cache: "no-store" })
+        fetch(`${API_BASE}/rates/latest?pair=${pair}`, { cache: "no-cache" }),
+        withHistory ? fetch(`${API_BASE}/rates/history?pair=${pair}`, { cache: "no-cache" }) : null
       ]);
 
-      if (!latestRes.ok || !historyRes.ok) throw new Error("Failed to fetch rates");
+      if (!latestRes.ok || (historyRes && !historyRes.ok)) throw new Error("Failed to fetch rates");
 
       const data: Rate[] = await latestRes.json();
-      const historyData: SourceHistory[] = await historyRes.json();
-
-      if (data.length > 0) {
-        // Find the maximum timestamp across all latest rates to determine the "freshest" data point
-        const maxTimestamp = Math.max(...data.map(r => new Date(r.timestamp).getTime()));
-        const fiveMinutesInMs = 5 * 60 * 1000;
-
-        // Filter sources that are older than 5 minutes from the freshest update
-        const filteredRates = data.filter(rate => {
-          const rateTime = new Date(rate.timestamp).getTime();
-          return (maxTimestamp - rateTime) <= fiveMinutesInMs;
-        });
-
-        setRates(filteredRates);
-        setBestRate(filteredRates.length > 0 ? filteredRates[0] : data[0]);
-      } else {
-        setRates([]);
-        setBestRate(null);
+      if (historyRes) {
+        const historyData: SourceHistory[] = await historyRes.json();
+        setHistory(historyData);
       }
-
-      setHistory(historyData);
-      setLastUpdated(new Date());
-      setError(null);
+      applyLatest(data);
     } catch (err) {
       setError(err instanceof Error ? err.message : "Unknown error");
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [applyLatest]);
 
   useEffect(() => {
     fetchRates();
     const interval = setInterval(fetchRates, pollInterval);
-    return () => clearInterval(interval);
-  }, [fetchRates, pollInterval]);
+
+    const onVisibilityChange = () => {
+      if (document.visibilityState === "visible") fetchRates();
+    };
+    document.addEventListener("visibilitychange", onVisibilityChange);
+
+    // Apply each scrape the backend publishes straight from the event; polling stays as a fallback
+    let source: EventSource | null = null;
+    if (typeof window !== "undefined" && "EventSource" in window) {
+      source = new EventSource(`${API_BASE}/rates/stream`);
+      source.addEventListener("rates", (event) => {
+        try {
+          const payload: RatesEvent = JSON.parse((event as MessageEvent).data);
+          const latest = payload.rates.filter(r => r.pair === PAIR);
+          applyLatest(latest);
+          setHistory(prev => mergeHistory(prev, latest));
+          setLoading(false);
+        } catch {
+          fetchRates();
+        }
+      });
+    }
+
+    return () => {
+      clearInterval(interval);
+      document.removeEventListener("visibilitychange", onVisibilityChange);
+      source?.close();
+    };
+  }, [fetchRates, applyLatest, pollInterval]);
 
   return { rates, history, bestRate, loading, error, lastUpdated, refresh: fetchRates };
 }
@@ -4,6 +4,7 @@ import { useState, useEffect, useCallback } from "react";
 import { TrendData } from "@/types";
 
 const API_BASE = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+const MAX_POINTS = 300;
 
 export function useTrends(days = 1, pollInterval = 60000) {
   const [trends, setTrends] = useState<TrendData | null>(null);
@@ -12,8 +13,8 @@ export function useTrends(days = 1, pollInterval = 60000) {
 
   const fetchTrends = useCallback(async () => {
     try {
-      const response = await fetch(`${API_BASE}/rates/trends?days=${days}&_t=${Date.now()}`, {
-        cache: "no-store"
+      const response = await fetch(`${API_BASE}/rates/trends?days=${days}&max_points=${MAX_POINTS}`, {
+        cache: "no-cache"
       });
       if (!response.ok) throw new Error("Failed to fetch trends");
 
@@ -16,6 +16,7 @@ export interface SourceHistory {
 
 export interface TrendData {
   period_days: number;
+  resolution?: string;
   data: {
     [source: string]: Array<{
       timestamp: string;